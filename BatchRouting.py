@@ -0,0 +1,113 @@
+"""
+Houses a batch query runner that routes many src/dest pairs across a pool of worker processes
+The graph's CSR arrays are published once through shared memory, so every worker searches the same copy of the graph
+instead of each being sent its own Graph (and its correlations)
+"""
+import numpy
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from CSRGraph import shortest_path
+
+# the format character of each shared array's type, used to view a shared block as a python sequence
+SHARED_FORMATS = {'offsets': 'q', 'targets': 'q', 'weights': 'd'}
+
+# the shared graph a worker process searches, set up by attach_shared_graph
+worker_graph = {}
+
+
+class SharedGraph:
+    """
+    SharedGraph Class
+    The offsets, targets, and one weight column of a CSRGraph copied into shared memory blocks, which worker processes
+    attach to by name
+    :field csr: the CSRGraph that was published
+    :field weight: the name of the weight column that was published, "distance" or "average_time"
+    :field blocks: a hash of array name to the SharedMemory block holding it
+    :field specs: a hash of array name to (block name, number of entries), what a worker needs to attach to the arrays
+    """
+    csr = None
+    weight = None
+    blocks = {}
+    specs = {}
+
+    def __init__(self, csr, weight="average_time"):
+        """
+        Constructor for the SharedGraph Class, copies the arrays into new shared memory blocks
+        :param csr: the CSRGraph to publish, from Graph.to_csr()
+        :param weight: the name of the weight column to publish, "distance" or "average_time"
+        """
+        self.csr = csr
+        self.weight = weight
+        self.blocks = {}
+        self.specs = {}
+        arrays = {'offsets': csr.offsets.astype(numpy.int64), 'targets': csr.targets.astype(numpy.int64),
+                  'weights': csr.weights[weight].astype(numpy.float64)}
+        for name, values in arrays.items():
+            # a block can't be 0 bytes, so an empty array still gets one entry's worth of memory
+            block = SharedMemory(create=True, size=max(values.nbytes, values.itemsize))
+            numpy.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+            self.blocks[name] = block
+            self.specs[name] = (block.name, len(values))
+
+    def close(self):
+        """
+        Releases the shared memory blocks, once no worker needs them anymore
+        :return: None
+        """
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach_shared_graph(specs):
+    """
+    Pool initializer, attaches a worker process to the blocks published by a SharedGraph
+    Each array is viewed through a memoryview cast to its type, so indexing it gives python numbers without copying
+    :param specs: a hash of array name to (block name, number of entries), from SharedGraph.specs
+    :return: None
+    """
+    worker_graph.clear()
+    for name, (block_name, length) in specs.items():
+        block = SharedMemory(name=block_name)
+        # the block has to stay open while its memoryview is in use
+        worker_graph[name + '_block'] = block
+        worker_graph[name] = block.buf.cast(SHARED_FORMATS[name])[:length]
+
+
+def route_indices(pair):
+    """
+    Dijkstra's algorithm over the worker's shared graph, the same search as csr_dijkstra
+    :param pair: (source index, target index), the vertex indices to search between
+    :return: (cost, path), the cost of the optimal path and its vertex indices (in the same order as dijkstra), or
+    (inf, None) if the target can't be reached
+    """
+    source, target = pair
+    return shortest_path(worker_graph['offsets'], worker_graph['targets'], worker_graph['weights'], source, target)
+
+
+def batch_route(graph, pairs, weight="average_time", processes=None, chunksize=64):
+    """
+    Routes every src/dest pair across a pool of worker processes, yielding the results in the order of pairs
+    The graph is published to shared memory for the length of the batch, so it is a snapshot of the graph's weights
+    when the batch starts
+    :param graph: a Graph object (or a CSRGraph, from Graph.to_csr())
+    :param pairs: an iterable of (src, dest) vertex objects
+    :param weight: the name of the edge weight to minimize, "distance" or "average_time"
+    :param processes: the number of worker processes, the number of cores if not given
+    :param chunksize: the number of pairs sent to a worker at a time, an int
+    :return: a generator of (cost, path), the cost of each pair's optimal path and the path (in the same order as
+    dijkstra), or (inf, None) if dest can't be reached
+    """
+    csr = graph if hasattr(graph, 'offsets') else graph.to_csr()
+    with SharedGraph(csr, weight) as shared:
+        with Pool(processes, initializer=attach_shared_graph, initargs=(shared.specs,)) as pool:
+            indices = ((csr.get_index(src), csr.get_index(dest)) for src, dest in pairs)
+            for cost, path in pool.imap(route_indices, indices, chunksize):
+                yield cost, None if path is None else csr.path_vertices(path)
@@ -0,0 +1,201 @@
+"""
+Houses a compact, read-only array representation of a Graph for the search algorithms
+Vertices are given dense integer indices and edges are stored in compressed sparse row (CSR) order, so a search can
+relax edges by indexing flat arrays instead of hashing vertex objects
+"""
+import numpy
+from heapq import heappush, heappop
+
+# the edge fields that are kept as weight columns
+CSR_WEIGHTS = ('distance', 'average_time')
+
+
+class CSRGraph:
+    """
+    CSRGraph Class
+    The edges leaving the vertex at index i are at positions offsets[i] up to offsets[i+1] of targets, edge_ids, and
+    each weight column
+    This is a snapshot of the graph it was made from, so it has to be made again after edge weights change (such as
+    when jams are created or cleared)
+    :field vertices: a list of vertex objects, ordered by their index
+    :field vertex_index: a hash of vertex object to its index
+    :field offsets: a numpy int array of length (number of vertices + 1), the start of each vertex's edges
+    :field targets: a numpy int array, the index of the second vertex of each edge
+    :field edge_ids: a numpy int array, the identifier of each edge
+    :field weights: a hash of weight name (from CSR_WEIGHTS) to a numpy float array of that value for each edge
+    """
+    vertices = []
+    vertex_index = {}
+    offsets = None
+    targets = None
+    edge_ids = None
+    weights = {}
+
+    def __init__(self, vertices, offsets, targets, edge_ids, weights):
+        """
+        Constructor for the CSRGraph Class
+        :param vertices: a list of vertex objects, ordered by their index
+        :param offsets: a numpy int array of length (number of vertices + 1), the start of each vertex's edges
+        :param targets: a numpy int array, the index of the second vertex of each edge
+        :param edge_ids: a numpy int array, the identifier of each edge
+        :param weights: a hash of weight name to a numpy float array of that value for each edge
+        """
+        self.vertices = vertices
+        self.vertex_index = {vertex: index for index, vertex in enumerate(vertices)}
+        self.offsets = offsets
+        self.targets = targets
+        self.edge_ids = edge_ids
+        self.weights = weights
+        self._structure = None
+        self._weight_lists = {}
+
+    @staticmethod
+    def from_graph(graph):
+        """
+        Creates the CSR representation of a graph
+        Vertices are indexed in order of their identifiers, and each vertex's edges are kept in the order of its
+        connections
+        :param graph: a Graph object
+        :return: a CSRGraph object
+        """
+        vertices = [graph.vertices[identifier] for identifier in sorted(graph.vertices.keys())]
+        vertex_index = {vertex: index for index, vertex in enumerate(vertices)}
+        offsets = [0]
+        targets = []
+        out_edges = []
+        for vertex in vertices:
+            # connections can list the same vertex twice when an edge was replaced, but only one edge is kept
+            for connection in dict.fromkeys(graph.connections.get(vertex, [])):
+                targets.append(vertex_index[connection])
+                out_edges.append(graph.edges[(vertex, connection)])
+            offsets.append(len(targets))
+
+        weights = {}
+        for name in CSR_WEIGHTS:
+            # None can't be held by a float array, so it is kept as NaN
+            weights[name] = numpy.array([numpy.nan if getattr(edge, name) is None else getattr(edge, name)
+                                         for edge in out_edges], dtype=numpy.float64)
+        return CSRGraph(vertices, numpy.array(offsets, dtype=numpy.int64), numpy.array(targets, dtype=numpy.int64),
+                        numpy.array([edge.identifier for edge in out_edges], dtype=numpy.int64), weights)
+
+    def get_num_vertices(self):
+        """
+        Gets the number of vertices in the graph
+        :return: an int, the number of vertices
+        """
+        return len(self.vertices)
+
+    def get_num_edges(self):
+        """
+        Gets the number of edges in the graph
+        :return: an int, the number of edges
+        """
+        return len(self.targets)
+
+    def get_index(self, vertex):
+        """
+        Gets the dense index of a vertex
+        :param vertex: a vertex object in the graph
+        :return: an int, the index of the vertex
+        """
+        return self.vertex_index[vertex]
+
+    def lists(self, weight):
+        """
+        Gets the offsets, targets, and a weight column as python lists, which are faster than numpy arrays to index one
+        entry at a time inside a search loop
+        The lists are only made once for each weight
+        :param weight: the name of the weight column, from CSR_WEIGHTS
+        :return: (offsets, targets, weights), a tuple of lists
+        """
+        if self._structure is None:
+            self._structure = (self.offsets.tolist(), self.targets.tolist())
+        if weight not in self._weight_lists:
+            self._weight_lists[weight] = self.weights[weight].tolist()
+        return self._structure + (self._weight_lists[weight],)
+
+    def edge_sources(self):
+        """
+        Gets the index of the first vertex of each edge, the edges' counterpart to targets
+        :return: a numpy int array, the index of the first vertex of each edge
+        """
+        return numpy.repeat(numpy.arange(len(self.vertices), dtype=numpy.int64), numpy.diff(self.offsets))
+
+    def reversed(self):
+        """
+        Creates the CSR representation of the graph with every edge flipped, so that the edges at a vertex's
+        positions are the edges coming into it
+        :return: a CSRGraph object, with the same vertex indices
+        """
+        sources = self.edge_sources()
+        order = numpy.argsort(self.targets, kind='stable')
+        counts = numpy.bincount(self.targets, minlength=len(self.vertices))
+        offsets = numpy.concatenate(([0], numpy.cumsum(counts))).astype(numpy.int64)
+        weights = {name: column[order] for name, column in self.weights.items()}
+        return CSRGraph(self.vertices, offsets, sources[order], self.edge_ids[order], weights)
+
+    def distances_from(self, source, weight):
+        """
+        Finds the distance from one vertex to every other vertex using Dijkstra's algorithm
+        :param source: the index of the vertex to search from
+        :param weight: the name of the weight column to add up, from CSR_WEIGHTS
+        :return: a numpy float array of the distance to each vertex index, inf for vertices that can't be reached
+        """
+        offsets, targets, weights = self.lists(weight)
+        distance = [numpy.inf] * len(self.vertices)
+        distance[source] = 0
+        q = [(0, source)]
+        while q:
+            current_distance, current_vertex = heappop(q)
+            if current_distance > distance[current_vertex]:
+                continue
+            for position in range(offsets[current_vertex], offsets[current_vertex + 1]):
+                connection = targets[position]
+                best_move = current_distance + weights[position]
+                if best_move < distance[connection]:
+                    distance[connection] = best_move
+                    heappush(q, (best_move, connection))
+        return numpy.array(distance, dtype=numpy.float64)
+
+    def path_vertices(self, path):
+        """
+        Converts a path of vertex indices into a path of vertex objects
+        :param path: a list of vertex indices
+        :return: a list of vertex objects
+        """
+        return [self.vertices[index] for index in path]
+
+
+def shortest_path(offsets, targets, weights, source, target):
+    """
+    Dijkstra's algorithm between two vertex indices of a graph in CSR order
+    The arrays only have to be indexable, so this searches python lists or views of shared memory alike
+    :param offsets: a sequence of length (number of vertices + 1), the start of each vertex's edges
+    :param targets: a sequence, the index of the second vertex of each edge
+    :param weights: a sequence, the weight of each edge
+    :param source: the index of the vertex to search from
+    :param target: the index of the vertex to search to
+    :return: (cost, path), the cost of the optimal path and its vertex indices (from target back to source, the same
+    order as dijkstra), or (inf, None) if the target can't be reached
+    """
+    distance = {source: 0}  # the distance value of each reached vertex index
+    parents = {}  # the parent of each reached vertex index, with respect to optimal path
+    q = [(0, source)]
+    while q:
+        current_distance, current_vertex = heappop(q)
+        if current_distance > distance[current_vertex]:
+            # a shorter way to this vertex was already expanded, so this entry is stale
+            continue
+        if current_vertex == target:
+            path = [target]
+            while path[-1] != source:
+                path.append(parents[path[-1]])
+            return current_distance, path
+        for position in range(offsets[current_vertex], offsets[current_vertex + 1]):
+            connection = targets[position]
+            best_move = current_distance + weights[position]
+            if connection not in distance or best_move < distance[connection]:
+                distance[connection] = best_move
+                parents[connection] = current_vertex
+                heappush(q, (best_move, connection))
+    return numpy.inf, None
@@ -0,0 +1,308 @@
+"""
+Houses the Contraction Hierarchies preprocessing and query engine for graphs with static edge weights
+Vertices are contracted one at a time from least to most important, adding shortcut edges so that distances between
+the remaining vertices are kept. A query then only has to search upward (towards more important vertices) from both
+ends, which settles a tiny fraction of the vertices that Dijkstra's algorithm would
+"""
+import numpy
+from heapq import heappush, heappop
+from math import inf
+from CSRGraph import CSRGraph
+
+WITNESS_SETTLE_LIMIT = 64  # the max number of vertices a witness search settles before giving up and adding a shortcut
+
+
+class ContractionHierarchy:
+    """
+    ContractionHierarchy Class
+    Upward edges are stored for every vertex as lists of (vertex index, cost), up_edges holds the edges leaving a vertex
+    towards more important vertices and down_edges holds the edges coming into a vertex from more important vertices
+    :field weight: the name of the edge weight the hierarchy was built on, "distance" or "average_time"
+    :field vertices: a list of vertex objects, ordered by their index
+    :field vertex_index: a hash of vertex object to its index
+    :field rank: a list of the contraction order of each vertex index, higher is more important
+    :field up_edges: a list, for each vertex index, of (vertex index, cost) edges leaving it upward
+    :field down_edges: a list, for each vertex index, of (vertex index, cost) edges coming into it from above
+    :field middles: a hash of (first index, second index) to the index of the vertex a shortcut skips, -1 for edges
+    of the original graph
+    """
+    weight = None
+    vertices = []
+    vertex_index = {}
+    rank = []
+    up_edges = []
+    down_edges = []
+    middles = {}
+
+    def __init__(self, weight, vertices, rank, up_edges, down_edges, middles):
+        """
+        Constructor for the ContractionHierarchy Class
+        :param weight: the name of the edge weight the hierarchy was built on
+        :param vertices: a list of vertex objects, ordered by their index
+        :param rank: a list of the contraction order of each vertex index
+        :param up_edges: a list, for each vertex index, of (vertex index, cost) edges leaving it upward
+        :param down_edges: a list, for each vertex index, of (vertex index, cost) edges coming into it from above
+        :param middles: a hash of (first index, second index) to the index of the vertex a shortcut skips
+        """
+        self.weight = weight
+        self.vertices = vertices
+        self.vertex_index = {vertex: index for index, vertex in enumerate(vertices)}
+        self.rank = rank
+        self.up_edges = up_edges
+        self.down_edges = down_edges
+        self.middles = middles
+
+    @staticmethod
+    def build(graph, weight="average_time"):
+        """
+        Contracts every vertex of a graph to build its hierarchy
+        Vertices are ordered by edge difference (the shortcuts contracting a vertex adds, less the edges it removes)
+        plus the number of its neighbors already contracted, which is kept up to date lazily
+        Edge weights are read once, so the hierarchy has to be built again after they change
+        :param graph: a Graph object
+        :param weight: the name of the edge weight to build on, "distance" or "average_time"
+        :return: a ContractionHierarchy object
+        """
+        csr = CSRGraph.from_graph(graph)
+        offsets, targets, weights = csr.lists(weight)
+        num_vertices = csr.get_num_vertices()
+        # the remaining graph, as hashes of neighbor index to (cost, middle) for each vertex index
+        out_edges = [{} for i in range(num_vertices)]
+        in_edges = [{} for i in range(num_vertices)]
+        for vertex in range(num_vertices):
+            for position in range(offsets[vertex], offsets[vertex + 1]):
+                connection = targets[position]
+                cost = weights[position]
+                if connection == vertex or cost != cost:
+                    # self loops are never on a shortest path, and NaN marks a missing weight
+                    continue
+                if connection not in out_edges[vertex] or cost < out_edges[vertex][connection][0]:
+                    out_edges[vertex][connection] = (cost, -1)
+                    in_edges[connection][vertex] = (cost, -1)
+
+        rank = [0] * num_vertices
+        up_edges = [[] for i in range(num_vertices)]
+        down_edges = [[] for i in range(num_vertices)]
+        middles = {}
+        contracted_neighbors = [0] * num_vertices
+
+        def priority(vertex):
+            shortcuts = ContractionHierarchy.find_shortcuts(vertex, out_edges, in_edges)
+            removed = len(out_edges[vertex]) + len(in_edges[vertex])
+            return len(shortcuts) - removed + contracted_neighbors[vertex]
+
+        q = [(priority(vertex), vertex) for vertex in range(num_vertices)]
+        q.sort()
+        order = 0
+        while q:
+            _, vertex = heappop(q)
+            # priorities go stale as neighbors are contracted, so check this one again before contracting
+            current = priority(vertex)
+            if q and current > q[0][0]:
+                heappush(q, (current, vertex))
+                continue
+
+            for first, second, cost in ContractionHierarchy.find_shortcuts(vertex, out_edges, in_edges):
+                if second not in out_edges[first] or cost < out_edges[first][second][0]:
+                    out_edges[first][second] = (cost, vertex)
+                    in_edges[second][first] = (cost, vertex)
+
+            # every edge left at the vertex goes to a more important vertex, so it becomes part of the hierarchy
+            for connection, (cost, middle) in out_edges[vertex].items():
+                up_edges[vertex].append((connection, cost))
+                middles[(vertex, connection)] = middle
+                del in_edges[connection][vertex]
+                contracted_neighbors[connection] += 1
+            for connection, (cost, middle) in in_edges[vertex].items():
+                down_edges[vertex].append((connection, cost))
+                middles[(connection, vertex)] = middle
+                del out_edges[connection][vertex]
+                contracted_neighbors[connection] += 1
+            out_edges[vertex] = {}
+            in_edges[vertex] = {}
+            rank[vertex] = order
+            order += 1
+
+        return ContractionHierarchy(weight, csr.vertices, rank, up_edges, down_edges, middles)
+
+    @staticmethod
+    def find_shortcuts(vertex, out_edges, in_edges):
+        """
+        Finds the shortcuts needed to contract a vertex out of the remaining graph
+        A shortcut (u, w) is needed when u -> vertex -> w is shorter than any witness path from u to w that avoids the
+        vertex. Witness searches are limited, so a shortcut may be added that isn't strictly needed, but never missed.
+        :param vertex: the index of the vertex to be contracted
+        :param out_edges: the remaining graph's edges leaving each vertex, a list of hashes of index to (cost, middle)
+        :param in_edges: the remaining graph's edges coming into each vertex, a list of hashes of index to (cost,
+        middle)
+        :return: a list of (first index, second index, cost) shortcuts
+        """
+        shortcuts = []
+        if not out_edges[vertex]:
+            return shortcuts
+        max_out = max(cost for cost, _ in out_edges[vertex].values())
+        for first, (cost_in, _) in in_edges[vertex].items():
+            witness = ContractionHierarchy.witness_search(first, vertex, cost_in + max_out, out_edges)
+            for second, (cost_out, _) in out_edges[vertex].items():
+                if second == first:
+                    continue
+                if witness.get(second, inf) > cost_in + cost_out:
+                    shortcuts.append((first, second, cost_in + cost_out))
+        return shortcuts
+
+    @staticmethod
+    def witness_search(source, excluded, max_cost, out_edges):
+        """
+        A limited Dijkstra's search through the remaining graph that avoids one vertex
+        :param source: the index of the vertex to search from
+        :param excluded: the index of the vertex being contracted, which the search can't pass through
+        :param max_cost: paths longer than this aren't searched
+        :param out_edges: the remaining graph's edges leaving each vertex, a list of hashes of index to (cost, middle)
+        :return: a hash of vertex index to the distance found to it
+        """
+        distance = {source: 0}
+        q = [(0, source)]
+        settled = 0
+        while q and settled < WITNESS_SETTLE_LIMIT:
+            current_distance, current_vertex = heappop(q)
+            if current_distance > distance[current_vertex]:
+                continue
+            if current_distance > max_cost:
+                break
+            settled += 1
+            for connection, (cost, _) in out_edges[current_vertex].items():
+                if connection == excluded:
+                    continue
+                best_move = current_distance + cost
+                if best_move < distance.get(connection, inf):
+                    distance[connection] = best_move
+                    heappush(q, (best_move, connection))
+        return distance
+
+    def query(self, src, dest):
+        """
+        Finds the optimal path from src to dest with a bidirectional search that only goes upward in the hierarchy
+        The path found goes through shortcuts, which are unpacked back into the vertices of the original graph
+        :param src: the source vertex to search from (a vertex object)
+        :param dest: the destination vertex to search to (a vertex object)
+        :return: a list which is the optimal path (in the same order as dijkstra), or None if dest can't be reached
+        """
+        source = self.vertex_index[src]
+        target = self.vertex_index[dest]
+        if source == target:
+            return [src]
+        adjacency = (self.up_edges, self.down_edges)
+        distance = ({source: 0}, {target: 0})
+        parents = ({}, {})
+        q = ([(0, source)], [(0, target)])
+        best_distance = inf
+        meeting_vertex = None
+        while (q[0] and q[0][0][0] < best_distance) or (q[1] and q[1][0][0] < best_distance):
+            # each side keeps going until its closest vertex can't improve on the best meeting point
+            if not q[1] or q[1][0][0] >= best_distance:
+                side = 0
+            elif not q[0] or q[0][0][0] >= best_distance:
+                side = 1
+            else:
+                side = 0 if q[0][0][0] <= q[1][0][0] else 1
+            current_distance, current_vertex = heappop(q[side])
+            if current_distance > distance[side][current_vertex]:
+                continue
+            if current_vertex in distance[1 - side] and \
+                    current_distance + distance[1 - side][current_vertex] < best_distance:
+                best_distance = current_distance + distance[1 - side][current_vertex]
+                meeting_vertex = current_vertex
+            for connection, cost in adjacency[side][current_vertex]:
+                best_move = current_distance + cost
+                if best_move < distance[side].get(connection, inf):
+                    distance[side][connection] = best_move
+                    parents[side][connection] = current_vertex
+                    heappush(q[side], (best_move, connection))
+
+        if meeting_vertex is None:
+            return None
+        hierarchy_path = [meeting_vertex]
+        while hierarchy_path[-1] != source:
+            hierarchy_path.append(parents[0][hierarchy_path[-1]])
+        hierarchy_path.reverse()
+        while hierarchy_path[-1] != target:
+            hierarchy_path.append(parents[1][hierarchy_path[-1]])
+
+        path = [source]
+        for i in range(1, len(hierarchy_path)):
+            self.unpack(hierarchy_path[i - 1], hierarchy_path[i], path)
+        return [self.vertices[index] for index in reversed(path)]
+
+    def unpack(self, first, second, path):
+        """
+        Unpacks a hierarchy edge into the edges of the original graph it stands for
+        :param first: the index of the first vertex of the edge
+        :param second: the index of the second vertex of the edge
+        :param path: a list of vertex indices ending with first, the rest of the edge's vertices are appended to it
+        :return: None
+        """
+        stack = [(first, second)]
+        while stack:
+            first, second = stack.pop()
+            middle = self.middles[(first, second)]
+            if middle < 0:
+                path.append(second)
+            else:
+                # the second half is pushed first, so that the first half is unpacked first
+                stack.append((middle, second))
+                stack.append((first, middle))
+
+    def to_arrays(self):
+        """
+        Gets the hierarchy as flat arrays, so it can be written with the graph by Graph.write_binary
+        Upward and downward edges are each written in CSR order, with the middle vertex of each edge alongside its cost
+        :return: a hash of array name to numpy array
+        """
+        arrays = {
+            'hierarchy_weight': numpy.array(self.weight),
+            'hierarchy_rank': numpy.array(self.rank, dtype=numpy.int64),
+        }
+        for name, edges, first_is_vertex in (('up', self.up_edges, True), ('down', self.down_edges, False)):
+            offsets = [0]
+            targets = []
+            costs = []
+            middles = []
+            for vertex, vertex_edges in enumerate(edges):
+                for connection, cost in vertex_edges:
+                    targets.append(connection)
+                    costs.append(cost)
+                    middles.append(self.middles[(vertex, connection) if first_is_vertex else (connection, vertex)])
+                offsets.append(len(targets))
+            arrays['hierarchy_' + name + '_offsets'] = numpy.array(offsets, dtype=numpy.int64)
+            arrays['hierarchy_' + name + '_targets'] = numpy.array(targets, dtype=numpy.int64)
+            arrays['hierarchy_' + name + '_costs'] = numpy.array(costs, dtype=numpy.float64)
+            arrays['hierarchy_' + name + '_middles'] = numpy.array(middles, dtype=numpy.int64)
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays, vertices):
+        """
+        Creates a hierarchy from the flat arrays written by to_arrays
+        :param arrays: a hash of array name to numpy array
+        :param vertices: a list of vertex objects, in the same order as when the hierarchy was written
+        :return: a ContractionHierarchy object
+        """
+        middles = {}
+        edge_lists = {}
+        for name, first_is_vertex in (('up', True), ('down', False)):
+            offsets = arrays['hierarchy_' + name + '_offsets'].tolist()
+            targets = arrays['hierarchy_' + name + '_targets'].tolist()
+            costs = arrays['hierarchy_' + name + '_costs'].tolist()
+            edge_middles = arrays['hierarchy_' + name + '_middles'].tolist()
+            edges = []
+            for vertex in range(len(offsets) - 1):
+                vertex_edges = []
+                for position in range(offsets[vertex], offsets[vertex + 1]):
+                    connection = targets[position]
+                    vertex_edges.append((connection, costs[position]))
+                    key = (vertex, connection) if first_is_vertex else (connection, vertex)
+                    middles[key] = edge_middles[position]
+                edges.append(vertex_edges)
+            edge_lists[name] = edges
+        return ContractionHierarchy(str(arrays['hierarchy_weight']), vertices, arrays['hierarchy_rank'].tolist(),
+                                    edge_lists['up'], edge_lists['down'], middles)
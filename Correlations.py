@@ -0,0 +1,211 @@
+"""
+Houses the correlation stores that a Graph can use for its edge_correlation in place of the dense double list
+Every store is indexed the same way as the double list, by edge identifiers: edge_correlation[i][j]
+"""
+from collections import OrderedDict
+from numpy import float32
+from numpy.lib.format import open_memmap
+
+
+class CorrelationRow(dict):
+    """
+    A single row of correlations, a dict of edge identifier to correlation
+    Pairs that are not stored have a correlation of 0
+    :field epsilon: correlations below this value are not stored, a float
+    """
+    epsilon = 0.0
+
+    def __init__(self, epsilon=0.0):
+        """
+        Constructor for a correlation row
+        :param OPTIONAL epsilon: correlations below this value are not stored, a float
+        """
+        super().__init__()
+        self.epsilon = epsilon
+
+    def __missing__(self, key):
+        return 0
+
+    def __setitem__(self, key, value):
+        if not value or value < self.epsilon:
+            # pruned pairs are read back as 0, so there is no need to keep them around
+            self.pop(key, None)
+        else:
+            super().__setitem__(key, value)
+
+
+class EmptyCorrelationRow(CorrelationRow):
+    """
+    The row read for every edge that has no stored correlations, one row is shared by all of them so that reading an
+    edge's row doesn't store anything
+    Rows that are going to be filled in come from SparseCorrelations.row instead
+    """
+
+    def __setitem__(self, key, value):
+        raise TypeError("The shared empty row can't be changed, rows to be filled in come from row()")
+
+
+class SparseCorrelations:
+    """
+    Sparse storage for the correlations between edges
+    Only the correlations that are at least epsilon are kept, a dict of rows is used so that memory grows with the
+    number of correlated pairs instead of the square of the number of edges
+    :field num_edges: the number of edge identifiers the correlations are indexed by, an int
+    :field epsilon: correlations below this value are dropped, a float
+    :field rows: a dict of edge identifier to its CorrelationRow
+    :field empty_row: the EmptyCorrelationRow read for edges that have no row
+    """
+    num_edges = 0
+    epsilon = 0.0
+    rows = {}
+    empty_row = None
+
+    def __init__(self, num_edges, epsilon=0.0):
+        """
+        Constructor for the sparse correlations
+        :param num_edges: the number of edge identifiers the correlations are indexed by, an int
+        :param OPTIONAL epsilon: correlations below this value are dropped, a float
+        """
+        self.num_edges = num_edges
+        self.epsilon = epsilon
+        self.rows = {}
+        self.empty_row = EmptyCorrelationRow(epsilon)
+
+    def __getitem__(self, edge_id):
+        return self.rows.get(edge_id, self.empty_row)
+
+    def row(self, edge_id):
+        """
+        Gets the row of an edge to be filled in, creating it if the edge has no row yet
+        :param edge_id: the identifier of the edge
+        :return: the edge's CorrelationRow
+        """
+        if edge_id not in self.rows:
+            self.rows[edge_id] = CorrelationRow(self.epsilon)
+        return self.rows[edge_id]
+
+    def __len__(self):
+        return self.num_edges
+
+    def __iter__(self):
+        for edge_id in range(self.num_edges):
+            yield self[edge_id]
+
+    def num_stored(self):
+        """
+        Gets the number of correlations that are actually stored
+        :return: an int, the number of kept pairs of edges
+        """
+        return sum(len(row) for row in self.rows.values())
+
+
+class LazyCorrelations:
+    """
+    Correlations between edges that are only found when they are looked up
+    The first lookup of edge_correlation[i] runs a bounded hop search from edge i, the row is then kept in a least
+    recently used cache so that memory depends on the edges near the routes being searched
+    :field graph: the graph whose edges are correlated
+    :field num_edges: the number of edge identifiers the correlations are indexed by, an int
+    :field max_hops: an int, edges more than this many hops apart have a correlation of 0 (None for no limit)
+    :field epsilon: correlations below this value are dropped, a float
+    :field cache_size: the max number of rows kept in the cache, an int
+    :field cache: an OrderedDict of edge identifier to CorrelationRow, from least to most recently used
+    :field connections: the edge adjacencies hash of the graph, found on the first lookup
+    """
+    graph = None
+    num_edges = 0
+    max_hops = None
+    epsilon = 0.0
+    cache_size = 0
+    cache = None
+    connections = None
+
+    def __init__(self, graph, num_edges, max_hops=None, epsilon=0.0, cache_size=1024):
+        """
+        Constructor for the lazy correlations
+        :param graph: the graph whose edges are correlated
+        :param num_edges: the number of edge identifiers the correlations are indexed by, an int
+        :param OPTIONAL max_hops: an int, edges more than this many hops apart have a correlation of 0
+        :param OPTIONAL epsilon: correlations below this value are dropped, a float
+        :param OPTIONAL cache_size: the max number of rows kept in the cache, an int
+        """
+        self.graph = graph
+        self.num_edges = num_edges
+        self.max_hops = max_hops
+        self.epsilon = epsilon
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.connections = None
+
+    def __getitem__(self, edge_id):
+        if edge_id in self.cache:
+            self.cache.move_to_end(edge_id)
+            return self.cache[edge_id]
+        if self.connections is None:
+            self.connections = self.graph.create_edge_connections()
+        row = self.graph.fill_correlation_row(edge_id, CorrelationRow(self.epsilon), self.connections, self.max_hops)
+        self.cache[edge_id] = row
+        if len(self.cache) > self.cache_size:
+            # throw out the least recently used row
+            self.cache.popitem(last=False)
+        return row
+
+    def __len__(self):
+        return self.num_edges
+
+    def __iter__(self):
+        for edge_id in range(self.num_edges):
+            yield self[edge_id]
+
+    def clear(self):
+        """
+        Clears the cached rows and edge adjacencies, so that they are found again from the graph
+        :return: None
+        """
+        self.cache.clear()
+        self.connections = None
+
+
+def create_correlation_file(file_name, num_edges):
+    """
+    Creates a dense float32 correlation matrix that is backed by a memory-mapped .npy file
+    Every entry starts out as 0, the matrix is written through to the file as it is filled in
+    :param file_name: the path to the .npy file to be created (an existing file is overwritten)
+    :param num_edges: the number of edge identifiers the correlations are indexed by, an int
+    :return: a writable numpy memmap of shape (num_edges, num_edges)
+    """
+    return open_memmap(file_name, mode='w+', dtype=float32, shape=(num_edges, num_edges))
+
+
+def open_correlation_file(file_name, writable=False):
+    """
+    Opens a correlation matrix saved by create_correlation_file or write_correlation_file
+    The matrix is memory-mapped rather than read, so processes that open the same file share one copy of it through
+    the page cache
+    :param file_name: the path to the .npy file
+    :param OPTIONAL writable: if True, changes to the matrix are written back to the file
+    :return: a numpy memmap indexed by edge identifiers
+    """
+    return open_memmap(file_name, mode='r+' if writable else 'r')
+
+
+def write_correlation_file(correlations, file_name):
+    """
+    Writes any correlation store (double list, SparseCorrelations, LazyCorrelations, or array) out to a
+    memory-mappable .npy file
+    :param correlations: the correlations to be written, indexed by edge identifiers
+    :param file_name: the path to the .npy file to be written
+    :return: None
+    """
+    num_edges = len(correlations)
+    matrix = create_correlation_file(file_name, num_edges)
+    for i in range(num_edges):
+        row = correlations[i]
+        if isinstance(row, CorrelationRow):
+            # only the kept pairs need to be written, everything else is already 0
+            for j, value in row.items():
+                matrix[i, j] = value
+        else:
+            matrix[i, :] = row
+    matrix.flush()
+    del matrix
@@ -2,9 +2,18 @@
 Created By Michael Bolot and John (Jack) Baumann for Fall 2018 - Spring 2019 research
 Houses functions to construct Nodes, Edges, and Graphs
 """
-import networkx
+import numpy
 from sys import maxsize
-from random import choice
+from array import array
+from collections import deque
+from random import Random
+from math import log, floor
+from os.path import abspath
+from CSRGraph import CSRGraph
+from Landmarks import Landmarks
+from ContractionHierarchy import ContractionHierarchy
+from Correlations import SparseCorrelations, LazyCorrelations, create_correlation_file, open_correlation_file, \
+    write_correlation_file
 
 
 class Graph:
@@ -14,6 +23,11 @@ class Graph:
     :field edges: A dictionary of the edges. Key is a tuple of (src, dest) and value is distance, an int, where src
     and dest are vertex objects
     :field connections: dictionary of vertex object to vertex object (indicates a connection between key and value)
+    :field reverse_connections: dictionary of vertex object to the vertex objects with a connection to it (the
+    incoming counterpart of connections)
+    :field coordinate_index: a hash of (latitude, longitude) to the vertex object at that position
+    :field spatial_index: the SpatialIndex used to find the vertices nearest a position, made the first time it is
+    needed
     :field seen: a table of seen vertices, used to indicate when a vertex was reached by an algorithm
     :field node_colors: a hash of a vertex object to its corresponding color
     :field edge_colors: a hash of (vert1, ver2) to an int representing the color of an edge (derived from optimal_color)
@@ -21,13 +35,32 @@ class Graph:
     :field optimal_color: an int, 2 means the edge is on an optimal path, 1 means it is a jam,
     0 means it is just an edge
     :field edge_correlation: a double list, indexed by edge identifiers, containing the correlations between any two
-    edges
+    edges (or a SparseCorrelations, LazyCorrelations, or memory-mapped float32 array indexed the same way)
     :field jams: a set of edge objects which indicate that an edge is jammed
+    :field jam_multipliers: a hash of each jammed edge object to the multiplier its average_time was jammed by, in the
+    order the edges were jammed
+    :field jam_random: the seeded random number generator that jams are picked with
+    :field open_edges: a list of the edge objects that aren't jammed, which create_jams samples from
+    :field open_positions: a hash of each edge object in open_edges to its position there, so that a jammed edge can
+    be taken out without searching for it
+    :field jam_influence: a list, indexed by edge identifiers, of the highest correlation between each edge and any
+    jammed edge (brought up to date by get_jam_influence for single_traffic_heuristic)
+    :field pending_jams: a list of the jammed edge objects that haven't been added to jam_influence yet
     :field deadline: The deadline that a graph algorithm has to run in, an int
+    :field max_speed_limit: the highest speed limit of any edge, found the first time it is needed
+    :field landmarks: the Landmarks used for A* lower bounds, or None until build_landmarks is called
+    :field hierarchy: the ContractionHierarchy used by hierarchy_search, or None until build_hierarchy is called
+    :field correlation_hops: the max number of hops between two edges for them to be correlated, an int (or None for
+    no limit)
+    :field version: an int that goes up every time the jams or edge weights change, so that anything worked out from
+    them (such as cached routes) can tell when it is out of date
     """
     vertices = {}
     edges = {}
     connections = {}
+    reverse_connections = {}
+    coordinate_index = {}
+    spatial_index = None
     seen = {}
     node_colors = {}
     edge_colors = {}
@@ -35,15 +68,37 @@ class Graph:
     optimal_color = 2
     edge_correlation = []
     jams = set()
+    jam_multipliers = {}
+    jam_random = None
+    open_edges = []
+    open_positions = {}
+    jam_influence = []
+    pending_jams = []
     deadline = None
-
-    def __init__(self, edges, correlations=None, deadline=None):
+    correlation_hops = None
+    max_speed_limit = None
+    landmarks = None
+    hierarchy = None
+    version = 0
+
+    def __init__(self, edges, correlations=None, deadline=None, correlation_hops=None, correlation_epsilon=None,
+                 correlation_file=None, lazy_correlations=False, correlation_cache_size=1024, jam_seed=None):
         """
         Constructor for the Graph Class
         Currently are bidirectional paths
         :param edges: A list of edges in the graph
         :param OPTIONAL correlations: the correlations which could be passed in
         :param OPTIONAL deadline: the deadline for the graph algorithm, used by one particular heuristic
+        :param OPTIONAL correlation_hops: edges more than this many hops apart are given a correlation of 0, an int
+        :param OPTIONAL correlation_epsilon: if given, the correlations are stored sparsely and any correlation below
+        this value is dropped, a float
+        :param OPTIONAL correlation_file: if given, the correlations are stored in a float32 matrix that is
+        memory-mapped to this .npy file
+        :param OPTIONAL lazy_correlations: if True, each row of correlations is only found when it is first looked up
+        and is then kept in a least recently used cache
+        :param OPTIONAL correlation_cache_size: the max number of rows kept by lazy correlations, an int
+        :param OPTIONAL jam_seed: the seed of the random number generator that jams are picked with, so that the same
+        jams are picked every time the graph is made
         """
 
         # first, reset any coloring or edge_identifiers that are left over
@@ -51,12 +106,61 @@ class Graph:
         self.clear_colors()
         edge_identifier_iterator = 0
         self.jams = set()
+        self.jam_multipliers = {}
+        self.jam_random = Random(jam_seed)
 
         if deadline:
             self.deadline = deadline
+        self.correlation_hops = correlation_hops
+        self.max_speed_limit = None
+        self.landmarks = None
+        self.hierarchy = None
+        self.version = 0
+
+        self.index_edges(edges)
+        self.set_open_edges(self.edges.values())
+        if self.positive_speed_limit() or self.zero_speed_limit():
+            #  if any speeds were given (even if they are 0 for unknown), then extrapolate the speeds
+            self.expand_speeds()
+            self.calculate_travel_times()
+        if correlations is None or len(correlations) == 0:
+            num_edges = self.get_num_edges()
+            if correlation_epsilon is not None and correlation_hops is None and 0 < correlation_epsilon < 1:
+                # 0.9**distance is below epsilon past this many hops, so there is no need to search any further
+                correlation_hops = floor(log(correlation_epsilon) / log(0.9))
+            self.correlation_hops = correlation_hops
+            if lazy_correlations:
+                # rows are only found when they are first looked up, so nothing is created up front
+                self.edge_correlation = LazyCorrelations(self, num_edges, correlation_hops, correlation_epsilon or 0.0,
+                                                         correlation_cache_size)
+            else:
+                if correlation_file is not None:
+                    self.edge_correlation = create_correlation_file(correlation_file, num_edges)
+                elif correlation_epsilon is not None:
+                    self.edge_correlation = SparseCorrelations(num_edges, correlation_epsilon)
+                else:
+                    # first fill in the list for the entries, edges that are never reached have a correlation of 0
+                    self.edge_correlation = [[0 for i in range(num_edges)] for j in range(num_edges)]
+                # we will arbitrarily fill in the list, so it is necessary to have a properly filled array
+                self.create_correlations(correlation_hops)
+                if correlation_file is not None:
+                    self.edge_correlation.flush()
+        else:
+            self.edge_correlation = correlations
+        self.clear_jam_influence()
+
+        self.create_jams(int(len(self.edges) * 0.05)) # jam 5% of roads (rounded down)
 
+    def index_edges(self, edges):
+        """
+        Builds the vertices, edges, connections, reverse_connections, and coordinate_index hashes of the graph from a
+        list of edges
+        :param edges: A list of edges in the graph
+        :return: None
+        """
         vertices = {}
         connections = {}
+        reverse_connections = {}
         parsed_edges = {}
         # first go through each of the passed in edges and extract vertexes from them
         # also, convert the edges list into the true edge hash that the graph needs for a field
@@ -79,23 +183,19 @@ class Graph:
             else:
                 connections[first_vertex].append(second_vertex)
 
+            if second_vertex not in reverse_connections:
+                reverse_connections[second_vertex] = [first_vertex]
+            else:
+                reverse_connections[second_vertex].append(first_vertex)
+
             parsed_edges[(first_vertex, second_vertex)] = edge
         self.edges = parsed_edges
         self.vertices = vertices
         self.connections = connections
-        if self.positive_speed_limit():
-            #  if we have at least one speed that we can expand off of, then extrapolate the speeds
-            self.expand_speeds()
-            self.calculate_travel_times()
-        if not correlations or len(correlations) == 0:
-            # first fill in the list for the entries
-            self.edge_correlation = [[None for i in range(len(self.edges))]for j in range(len(self.edges))]
-            # we will arbitrarily fill in the list, so it is necessary to have a properly filled array
-            self.create_correlations()
-        else:
-            self.edge_correlation = correlations
-
-        self.create_jams(int(len(self.edges) * 0.05)) # jam 5% of roads (rounded down)
+        self.reverse_connections = reverse_connections
+        self.coordinate_index = {(vertex.get_latitude(), vertex.get_longitude()): vertex
+                                 for vertex in vertices.values()}
+        self.spatial_index = None
 
     def create_edge_connections(self):
         """
@@ -121,54 +221,82 @@ class Graph:
                 connections[connected_edge.identifier].add(edge_obj.identifier)
         return connections
 
-    def edge_distance(self):
+    @staticmethod
+    def edge_hops(start_edge, connections, max_hops=None):
+        """
+        Finds the number of hops from one edge to every edge that can be reached from it
+        Every edge connection has a weight of 1, so a breadth first search finds the shortest distances
+        :param start_edge: the identifier of the edge to search from
+        :param connections: the edge adjacencies hash from create_edge_connections
+        :param OPTIONAL max_hops: an int, edges further than this many hops from start_edge are not searched
+        :return: a dict from edge identifier to its distance in hops from start_edge
+        """
+        hops = {start_edge: 0}
+        frontier = deque([start_edge])
+        while frontier:
+            current_edge = frontier.popleft()
+            distance = hops[current_edge] + 1
+            if max_hops is not None and distance > max_hops:
+                # everything else in the frontier is at least this far away, so nothing more can be added
+                break
+            for next_edge in connections[current_edge]:
+                if next_edge not in hops:
+                    hops[next_edge] = distance
+                    frontier.append(next_edge)
+        return hops
+
+    def edge_distance(self, max_hops=None):
         """
         finds the distance between each pair of edges in the graph
-        uses floyd-warshall to find the distances
-        :return: void
-        """
-        connections = self.create_edge_connections() # first find out which edges are connected
-        # index distances by edge_id
-        distances = [[maxsize for i in range(len(self.edges))] for j in range(len(self.edges))]
-        # if edges are connected, the distance between them is set to 1
-        for start_edge in connections:
-            for end_edge in connections[start_edge]:
-                distances[start_edge][end_edge] = 1
-        # edges have a zero distance from themselves
-        for edge in self.edges:
-            edge_obj = self.edges[edge]
-            distances[edge_obj.identifier][edge_obj.identifier] = 0
+        uses a breadth first search from each edge over the edge connections to find the distances
+        :param OPTIONAL max_hops: an int, pairs of edges further apart than this are left at maxsize
+        :return: a double list indexed by edge identifiers of the distance between each pair of edges, maxsize for
+        pairs of edges that are not connected
+        """
+        connections = self.create_edge_connections()  # first find out which edges are connected
+        num_edges = self.get_num_edges()
+        distances = [[maxsize for i in range(num_edges)] for j in range(num_edges)]
         for edge in self.edges:
-            k = self.edges[edge].identifier
-            for second_edge in self.edges:
-                i = self.edges[second_edge].identifier
-                for third_edge in self.edges:
-                    j = self.edges[third_edge].identifier
-                    if distances[i][j] > distances[i][k] + distances[k][j]:
-                        distances[i][j] = distances[i][k] + distances[k][j]
+            edge_id = self.edges[edge].identifier
+            for second_id, distance in self.edge_hops(edge_id, connections, max_hops).items():
+                distances[edge_id][second_id] = distance
         return distances
 
-    def create_correlations(self):
+    def create_correlations(self, max_hops=None):
         """
         Spreads the correlations out through the whole graph
-        Currently very slow, distances are being re-calculated
+        The distances from each edge are found one edge at a time, so only one row of distances is held at once
+        :param OPTIONAL max_hops: an int, edges more than this many hops apart are left with a correlation of 0
         :return: None
         """
-        distances = self.edge_distance()
+        connections = self.create_edge_connections()  # first find out which edges are connected
+        sparse = isinstance(self.edge_correlation, SparseCorrelations)
+        for edge in self.edges:
+            first_id = self.edges[edge].get_identifier()
+            # sparse rows are shared until they are asked for to be filled in
+            correlation_row = self.edge_correlation.row(first_id) if sparse else self.edge_correlation[first_id]
+            self.fill_correlation_row(first_id, correlation_row, connections, max_hops)
+
+    def fill_correlation_row(self, edge_id, correlation_row, connections, max_hops=None):
+        """
+        Fills in the correlations between one edge and every other edge it is connected to
+        :param edge_id: the identifier of the edge whose row is filled in
+        :param correlation_row: the row to be filled in, indexed by edge identifiers
+        :param connections: the edge adjacencies hash from create_edge_connections
+        :param OPTIONAL max_hops: an int, edges more than this many hops away are left with a correlation of 0
+        :return: correlation_row, the filled in row
+        """
+        if edge_id not in connections:
+            return correlation_row
         # for each edge, find the distance and use the heuristic of 0.9**distance to create a correlation
         # not a solid mathematical principle, more of an approximation
         # potential issue: two-direction roads are correlated. Might make sense in case of a major accident
         # doesn't make sense in the case of general traffic though
-        for edge in self.edges:
-            first_edge = self.edges[edge]
-            for other_edge in self.edges:
-                second_edge = self.edges[other_edge]
-                distance = distances[first_edge.get_identifier()][second_edge.get_identifier()]
-                if not distance:
-                    corr = 0
-                else:
-                    corr = 0.9**float(distance)
-                self.edge_correlation[first_edge.get_identifier()][second_edge.get_identifier()] = corr
+        for second_id, distance in self.edge_hops(edge_id, connections, max_hops).items():
+            # an edge has a distance of 0 from itself, which is given a correlation of 0
+            if distance:
+                correlation_row[second_id] = 0.9**float(distance)
+        return correlation_row
 
     def connected(self, src, dest):
         """
@@ -191,6 +319,37 @@ class Graph:
         vertex = self.vertices[vertex_id]
         return vertex
 
+    def get_vertex_at(self, latitude, longitude):
+        """
+        Returns the vertex object at an exact position, using the coordinate index instead of searching the vertices
+        :param latitude: the latitude coordinate of the vertex
+        :param longitude: the longitude coordinate of the vertex
+        :return: vertex, the found vertex object, or None if no vertex is at that position
+        """
+        return self.coordinate_index.get((latitude, longitude))
+
+    def get_spatial_index(self):
+        """
+        Gets the spatial index of the graph's vertices, for finding the vertices nearest GPS coordinates
+        The index is made the first time it is needed and kept until the vertices change
+        :return: the SpatialIndex object, which is also kept in self.spatial_index
+        """
+        if self.spatial_index is None:
+            # SpatialIndex uses the haversine functions of OSMParser, which imports this module
+            from SpatialIndex import SpatialIndex
+            self.spatial_index = SpatialIndex(self.vertices.values())
+        return self.spatial_index
+
+    def get_nearest_vertex(self, latitude, longitude):
+        """
+        Returns the vertex object closest to a position, by haversine distance
+        :param latitude: the latitude of the position
+        :param longitude: the longitude of the position
+        :return: vertex, the nearest vertex object, or None if the graph has no vertices
+        """
+        nearest = self.get_spatial_index().nearest(latitude, longitude)
+        return nearest[0][1] if nearest else None
+
     def distance(self, src, dest):
         """
         Finds the distance between two connected vertices
@@ -263,55 +422,48 @@ class Graph:
                 return True
         return False
 
+    def get_max_speed_limit(self):
+        """
+        Gets the highest speed limit of any edge, used to bound travel times from below
+        Speed limits are fixed once the graph is made, so it is only found once
+        :return: the highest speed limit, a number (0 if no edge has a speed limit)
+        """
+        if self.max_speed_limit is None:
+            self.max_speed_limit = max((self.edges[edge].get_speed_limit() or 0 for edge in self.edges), default=0)
+        return self.max_speed_limit
+
     def expand_speeds(self):
         """
-        expands the speed limit of valid roads to 0-marked roads
+        expands the speed limit of valid roads to roads without one (marked 0 or None)
         Views the edges as nodes of a graph and the vertices as edges of a graph
-        Two edges are connected if they share a node in common
+        Two edges are connected if they share a node in common, so (1,2) is connected to both (2,3) and (0,1)
+        One breadth first search is started from every road with a speed limit at once, so each road without one takes
+        its speed limit from the nearest road that has one, and every edge is only visited once
+        Roads that aren't connected to any road with a speed limit are given DEFAULT_SPEED_LIMIT
         :return: None
         """
-        while self.zero_speed_limit():
-            for vertex_id, first_vert in enumerate(self.vertices):
-                if first_vert not in self.connections:
-                    # if the vertex isn't connected to anything, there is no edge to evaluate
-                    continue
-                for second_vert in self.connections[first_vert]:
-                    # if there is an edge to be evaluated, grab the edge object
-                    start_edge = self.edges[(first_vert, second_vert)]
-                    if start_edge.get_speed_limit() == 0:
-                        # if the edge doesn't have a speed limit, try to grab one from a neighbor that does
-                        # only goes "forward"
-                        # (1,2) will only discover (2,3) and not (0,1), this is corrected by the else
-                        if second_vert not in self.connections:
-                            continue
-                        for third_vert in self.connections[second_vert]:
-                            current_limit = self.edges[(second_vert, third_vert)].get_speed_limit()
-                            if current_limit == 0:
-                                # if we can't grab a speed limit from this new edge, just continue
-                                continue
-                            if current_limit > 40:
-                                # if we can grab a speed limit , grab it and reduce by 5
-                                current_limit -= 5
-                                # however, never reduce the speed limit below 40 (this is to stop edges from having
-                                # obscenely low speed limits like 5mph
-                                if current_limit < 40:
-                                    current_limit = 40
-                            start_edge.speed_limit = current_limit
-                            break
-                    else:
-                        if second_vert not in self.connections:
-                            continue
-                        current_limit = start_edge.get_speed_limit()
-                        if current_limit > 40:
-                            current_limit -= 5
-                            if current_limit < 40:
-                                current_limit = 40
-                        # if you have a speed limit, spread forward to edges that don't
-                        # (1,2) won't see (0,1) but (0,1) will see (1,2) this way everything (1,2) is connected to
-                        # will interact with (1,2)
-                        for third_vert in self.connections[second_vert]:
-                            if self.edges[(second_vert, third_vert)].get_speed_limit() == 0:
-                                self.edges[(second_vert, third_vert)].speed_limit = current_limit
+        queue = deque(edge for edge in self.edges.values() if edge.get_speed_limit())
+        while queue:
+            edge = queue.popleft()
+            current_limit = edge.get_speed_limit()
+            if current_limit > 40:
+                # if we can grab a speed limit, grab it and reduce by 5
+                # however, never reduce the speed limit below 40 (this is to stop edges from having obscenely low speed
+                # limits like 5mph
+                current_limit = max(current_limit - 5, 40)
+            # spread to the roads leaving the end of this one, and the roads coming into its start
+            neighbors = [self.edges[(edge.second_vertex, third_vert)]
+                         for third_vert in self.connections.get(edge.second_vertex, [])]
+            neighbors += [self.edges[(zeroth_vert, edge.first_vertex)]
+                          for zeroth_vert in self.reverse_connections.get(edge.first_vertex, [])]
+            for neighbor in neighbors:
+                if not neighbor.get_speed_limit():
+                    neighbor.speed_limit = current_limit
+                    queue.append(neighbor)
+
+        for edge in self.edges.values():
+            if not edge.get_speed_limit():
+                edge.speed_limit = DEFAULT_SPEED_LIMIT
 
     def calculate_travel_times(self):
         """
@@ -324,6 +476,7 @@ class Graph:
                 distance = self.edges[edge].get_distance()
                 travel_time = distance / speed
                 self.edges[edge].set_average_time(travel_time)
+        self.version += 1
 
     def clear_jams(self):
         """
@@ -335,80 +488,196 @@ class Graph:
             # would just reset the jams, but we also need to cut down the average travel time from the earlier
             # inflatement
             remove_list.append(jam)
-            jam.average_time /= 2
+            jam.average_time /= self.jam_multipliers.get(jam, 2)
 
         for edge in remove_list:
             self.jams.remove(edge)
+        # the edges can be picked by create_jams again, and are put back in the order they were jammed
+        for edge in self.jam_multipliers:
+            self.open_positions[edge] = len(self.open_edges)
+            self.open_edges.append(edge)
+        self.jam_multipliers = {}
+        self.clear_jam_influence()
+        self.version += 1
 
     def specify_jams(self, coords):
         """
         Jams specific edges specified in coords
         Will remove all other jams
+        Each vertex is found through the coordinate index, and any edge that can't be found is skipped and reported
+        rather than stopping the rest from being jammed. An entry that only matches the reverse of an edge jams that
+        edge, and is also reported
         :param coords: the list of ((x1, y1) ,(x2,y2)) where x1 and x2 are latitude coordinates of vertices and y1 and
         y2 are longitude coordinates of vertices
-        :return: None
+        :return: a list of (entry, reason) for the entries of coords that weren't jammed as given, where reason is
+        "vertex not found", "edge not found", or "reversed" (the reverse of the edge was jammed instead)
         """
         self.clear_jams()  # if you want to specify an edge to jam, you must specify all edges to be jammed
+        unresolved = []
         for implicit_edge in coords:
-            implicit_s_vert = implicit_edge[0]
-            implicit_e_vert = implicit_edge[1]
-            s_vert = None  # meant to hold the starting vertex object once identified
-            e_vert = None  # meant to hold the starting vertex object once identified
-            for vert in self.vertices:
-                vert_obj = self.vertices[vert]
-                if vert_obj.get_latitude() == implicit_s_vert[0] and vert_obj.get_longitude() == implicit_s_vert[1]:
-                    s_vert = vert_obj
-                elif vert_obj.get_latitude() == implicit_e_vert[0] and vert_obj.get_longitude() == implicit_e_vert[1]:
-                    e_vert = vert_obj
-
-                if s_vert and e_vert:
-                    break
+            s_vert = self.get_vertex_at(*implicit_edge[0])
+            e_vert = self.get_vertex_at(*implicit_edge[1])
             if not s_vert or not e_vert:
-                print("One or more Vertices was not valid try again")
-                return
-            edge_obj = None
+                unresolved.append((implicit_edge, "vertex not found"))
+                continue
             # finds the edge object of the specified edge
             if (s_vert, e_vert) in self.edges:
                 edge_obj = self.edges[(s_vert, e_vert)]
             elif (e_vert, s_vert) in self.edges:
                 # currently will allow a user to specify the reverse of an edge
                 edge_obj = self.edges[(e_vert, s_vert)]
-                print("Warning: FOUND REVERSE OF SPECIFIED EDGE")
+                unresolved.append((implicit_edge, "reversed"))
             else:
-                print("Specified edge isn't an edge")
+                unresolved.append((implicit_edge, "edge not found"))
+                continue
             self.jam_edge(edge_obj)
+        return unresolved
 
-    def create_jam(self):
+    def create_jam(self, multiplier=2):
         """
         Jams a single edge chosen at random
+        :param OPTIONAL multiplier: the number the edge's average_time is multiplied by
         :return:
         """
-        # this code found at: https://stackoverflow.com/questions/4859292/how-to-get-a-random-value-in-python-dictionary
-        vert_edge = choice(list(self.edges.keys()))
-        true_edge = self.edges[vert_edge]
-        while true_edge in self.jams:
-            # if we choose an edge that is already jammed, keep trying until we get an edge that is not jammed
-            vert_edge = choice(list(self.edges.keys()))
-            true_edge = self.edges[vert_edge]
-        self.jam_edge(true_edge)
+        self.create_jams(1, multiplier)
 
-    def jam_edge(self, edge):
+    def jam_edge(self, edge, multiplier=2):
         """
         Jams an individual Edge
         :param edge: the edge to be jammed (an edge object)
+        :param OPTIONAL multiplier: the number the edge's average_time is multiplied by
         :return: None
         """
-        edge.average_time *= 2
+        edge.average_time *= multiplier
         self.jams.add(edge)
+        # jamming an edge that is already jammed stacks the multipliers, so clearing it undoes both
+        self.jam_multipliers[edge] = self.jam_multipliers.get(edge, 1) * multiplier
+        self.close_edge(edge)
+        # the jam's row of correlations is only looked up once the influence is needed, which keeps lazy correlations
+        # from finding a row for every jam when the graph is made
+        self.pending_jams.append(edge)
+        self.version += 1
+
+    def add_jam_influence(self, jam):
+        """
+        Raises the jam influence of every edge to its correlation with a newly jammed edge
+        :param jam: the jammed edge (an edge object)
+        :return: None
+        """
+        correlations = self.edge_correlation
+        if not len(correlations):
+            return
+        influence = self.jam_influence
+        if isinstance(correlations, (SparseCorrelations, LazyCorrelations)):
+            # sparse and lazy rows are found the same way in both directions, so the jam's row is also its column
+            jam_correlations = correlations[jam.identifier].items()
+        elif isinstance(correlations, numpy.ndarray):
+            # correlations are symmetric, so the jam's row is read rather than its column, which would touch every
+            # page of a memory-mapped file
+            jam_correlations = enumerate(correlations[jam.identifier].tolist())
+        else:
+            jam_correlations = enumerate(row[jam.identifier] for row in correlations)
+        for edge_id, correlation in jam_correlations:
+            if correlation > influence[edge_id]:
+                influence[edge_id] = correlation
+
+    def clear_jam_influence(self):
+        """
+        Resets the jam influence of every edge to 0, for when there are no jams
+        :return: None
+        """
+        self.jam_influence = [0] * (len(self.edge_correlation) or self.get_num_edges())
+        self.pending_jams = []
+
+    def get_jam_influence(self, edge):
+        """
+        Gets the highest correlation between an edge and any jammed edge, first adding the influence of any jams made
+        since it was last looked up
+        :param edge: the edge to get the jam influence of (an edge object)
+        :return: the highest correlation between edge and any jammed edge, or 0 if there are no jams
+        """
+        if self.pending_jams:
+            for jam in self.pending_jams:
+                self.add_jam_influence(jam)
+            self.pending_jams = []
+        return self.jam_influence[edge.identifier]
 
-    def create_jams(self, num_jams):
+    def set_edge_weight(self, edge, name, value):
+        """
+        Changes one of an edge's values, such as its average_time or distance
+        Edge weights should be changed through here rather than on the edge itself, so that the graph's version is
+        updated
+        :param edge: the edge to be changed (an edge object)
+        :param name: the name of the edge field to be changed, from BINARY_EDGE_COLUMNS
+        :param value: the new value of the field
+        :return: None
+        """
+        if name not in BINARY_EDGE_COLUMNS:
+            raise ValueError("Unknown edge weight: {0}".format(name))
+        setattr(edge, name, value)
+        if name == 'speed_limit':
+            self.max_speed_limit = None
+        self.version += 1
+
+    def create_jams(self, num_jams, multiplier=2):
         """
-        Handler function for repeat calls of create_jams
+        Jams edges chosen at random, with the graph's seeded random number generator
+        The edges are sampled without replacement from open_edges, which jam_edge and clear_jams keep up to date, so no
+        edge is picked twice and the edges that aren't jammed don't have to be gathered on every call
         :param num_jams: an int, representing the number of jams
+        :param OPTIONAL multiplier: the number each edge's average_time is multiplied by
+        :return: None
+        """
+        for edge in self.jam_random.sample(self.open_edges, min(num_jams, len(self.open_edges))):
+            self.jam_edge(edge, multiplier)
+
+    def set_open_edges(self, open_edges):
+        """
+        Sets the edges that create_jams samples from
+        :param open_edges: a list of the edge objects that aren't jammed, in the order they are sampled from
         :return: None
         """
-        for i in range(num_jams):
-            self.create_jam()
+        self.open_edges = list(open_edges)
+        self.open_positions = {edge: position for position, edge in enumerate(self.open_edges)}
+
+    def close_edge(self, edge):
+        """
+        Takes an edge out of open_edges, by moving the last of open_edges into its position
+        :param edge: the edge object that was jammed
+        :return: None
+        """
+        position = self.open_positions.pop(edge, None)
+        if position is None:
+            # the edge was already jammed
+            return
+        last_edge = self.open_edges.pop()
+        if last_edge is not edge:
+            self.open_edges[position] = last_edge
+            self.open_positions[last_edge] = position
+
+    def record_jams(self):
+        """
+        Records the current jams as a scenario, which can be replayed on this graph (or a copy of it) by replay_jams
+        :return: a list of (edge identifier, multiplier) for each jam, in the order the edges were jammed
+        """
+        return [(edge.identifier, multiplier) for edge, multiplier in self.jam_multipliers.items()]
+
+    def replay_jams(self, scenario):
+        """
+        Jams exactly the edges of a scenario recorded by record_jams
+        Will remove all other jams
+        :param scenario: a list of (edge identifier, multiplier)
+        :return: a list of the entries of scenario that weren't jammed, because the edge wasn't found
+        """
+        self.clear_jams()
+        edges_by_id = {edge.identifier: edge for edge in self.edges.values()}
+        unresolved = []
+        for edge_id, multiplier in scenario:
+            if edge_id not in edges_by_id:
+                unresolved.append((edge_id, multiplier))
+                continue
+            self.jam_edge(edges_by_id[edge_id], multiplier)
+        return unresolved
 
     def clear_colors(self):
         """
@@ -426,6 +695,8 @@ class Graph:
         Converts a graph into a networkx graph
         :return: A networkx graph object
         """
+        # networkx is slow to import and only needed for displaying graphs, so it isn't imported until then
+        import networkx
         new_graph = networkx.DiGraph()
         for vertex in self.vertices:
             vertex_obj = self.vertices[vertex]
@@ -485,119 +756,326 @@ class Graph:
         return parsed_graph
 
     @staticmethod
-    def read_graph(file_name):
+    def read_graph_lines(input_file):
+        """
+        Streams the lines of a graph stored in a .txt file, one line at a time
+        :param input_file: an open .txt file written by write_graph
+        :return: a generator of (section, values) where section is "VERTICES", "EDGES", or "CORRELATIONS" and values is
+        the list of comma separated values on a line in that section
+        """
+        section = None
+        for line in input_file:
+            line = line.strip()
+
+            if line == '':
+                continue
+
+            # flag marking for the purposes of discovering which part of the graph sav file is to be processed
+            if line in GRAPH_FILE_SECTIONS:
+                section = line
+                continue
+
+            # rows of correlations end with a trailing comma, which leaves an empty value at the end
+            yield section, [value for value in line.split(",") if value != '']
+
+    @staticmethod
+    def read_graph(file_name, correlation_file=None):
         """
         Reads in a graph stored in a .txt file with the name fileName
+        The file is streamed one line at a time, and each row of correlations is held as a compact array of doubles
         :param file_name: the path to a .txt file
+        :param OPTIONAL correlation_file: the path to a .npy file written by write_graph, if given the correlations are
+        memory-mapped from it and any CORRELATIONS block in the .txt file is skipped
         :return: a Graph object
         """
-        with open(file_name, 'r') as input_file:
+        # edges are numbered from 0 (unless the file gives their identifiers), the same as for a new graph
+        global edge_identifier_iterator
+        edge_identifier_iterator = 0
+        with open(file_name, 'r', buffering=GRAPH_FILE_BUFFER) as input_file:
             edges = []
-            edge_flag = 0
-            vertices = []  # ordered list of vertices
+            vertices = {}  # hash of vertex id to vertex
             correlations = None
-            vertices_flag = 0
-            corr_flag = 0
-            for line in input_file:
-                line = line.strip()
-
-                if line == '':
-                    continue
-
-                # flag marking for the purposes of discovering which part of the graph sav file is to be processed
-                if line == "VERTICES":
-                    edge_flag = 0
-                    vertices_flag = 1
-                    continue
-
-                if line == "EDGES":
-                    edge_flag = 1
-                    vertices_flag = 0
-                    continue
-
-                if line == "CORRELATIONS":
-                    edge_flag = 0
-                    vertices_flag = 0
-                    corr_flag = 1
-                    correlations = []
-
-                if edge_flag == 1:
-                    #  if we are in the edges block, read in the edges
-                    parsed_line = tuple(map(float, line.split(",")))
-                    num_data = len(parsed_line)
-                    edge = Edge(vertices[int(parsed_line[0])], vertices[int(parsed_line[1])], parsed_line[2])
-                    if num_data > 3:
-                        edge.set_average_time(parsed_line[3])
-                    if num_data > 4:
-                        edge.set_standard_deviation_time(parsed_line[4])
-                    if num_data > 5:
-                        edge.set_speed_limit(parsed_line[5])
-                    if num_data > 6:
-                        edge.set_average_speed(parsed_line[6])
-                    if num_data > 7:
-                        edge.set_standard_deviation_speed(parsed_line[7])
-                    edges.append(edge)
-
-                if vertices_flag == 1:
+            for section, values in Graph.read_graph_lines(input_file):
+                if section == "VERTICES":
                     #  if we are in the vertices block, read in the vertices
-                    parsed_line = tuple(map(int, line.split(",")))
-                    vertices.append(Vertex(parsed_line[0], parsed_line[1], parsed_line[2]))
+                    vertex = Vertex(int(values[0]), parse_number(values[1]), parse_number(values[2]))
+                    vertices[vertex.get_identifier()] = vertex
+
+                elif section == "EDGES":
+                    #  if we are in the edges block, read in the edges, values that were None are left as None
+                    edge = Edge(vertices[int(values[0])], vertices[int(values[1])], float(values[2]))
+                    for name, value in zip(BINARY_EDGE_COLUMNS[1:], values[3:]):
+                        if value != 'None':
+                            setattr(edge, name, float(value))
+                    if len(values) > 2 + len(BINARY_EDGE_COLUMNS):
+                        # the identifier comes after every edge value, so the edge keeps its row of correlations
+                        edge.identifier = int(values[2 + len(BINARY_EDGE_COLUMNS)])
+                    edges.append(edge)
 
-                if corr_flag == 1:
+                elif section == "CORRELATIONS":
+                    if correlation_file is not None:
+                        # the correlations come from the memory-mapped file, so there's no need to parse them
+                        break
                     #  if we are in the correlations block, read in the correlations
-                    val = line.split(",")
-                    val.remove(' ')
-                    parsed_line = tuple(map(float, val))
-                    correlations.append(parsed_line)
+                    if correlations is None:
+                        correlations = []
+                    correlations.append(array('d', map(float, values)))
 
-            return Graph(edges, correlations)
+        if correlation_file is not None:
+            correlations = open_correlation_file(correlation_file)
+        return Graph(edges, correlations)
 
-    def write_graph(self, file_name):
+    def graph_lines(self, include_correlations=True):
+        """
+        Streams the lines of the .txt representation of the graph, one line at a time
+        :param OPTIONAL include_correlations: if False, the CORRELATIONS block is left out
+        :return: a generator of strings, each one a line of the file ending with a newline
+        """
+        yield "VERTICES\n"
+        for identifier in sorted(self.vertices.keys()):
+            current_vertex = self.vertices[identifier]
+            yield "{0},{1},{2}\n".format(current_vertex.get_identifier(), current_vertex.get_latitude(),
+                                         current_vertex.get_longitude())
+        yield "\n\nEDGES\n"
+        for edge in sorted(self.edges.values(), key=Edge.get_identifier):
+            # casting a vert to a string casts the vert's id to a string
+            values = [str(edge.first_vertex), str(edge.second_vertex)]
+            values.extend(str(getattr(edge, name)) for name in BINARY_EDGE_COLUMNS)
+            values.append(str(edge.identifier))
+            yield ",".join(values) + "\n"
+        if not include_correlations:
+            return
+        yield "CORRELATIONS\n"
+        num_edges = len(self.edge_correlation)
+        for edge_list in self.edge_correlation:
+            # index each entry, since sparse rows only hold the pairs that were kept
+            yield "".join([str(edge_list[j]) + "," for j in range(num_edges)]) + "\n"
+
+    def write_graph(self, file_name, correlation_file=None):
         """
         Writes a graph to a file, so that it can be retrieved later
-        Graphs are written in 3 sections: Vertices (which has lat, long, and id), Edges (which have first_vertex id,
-        second_vertex id, average_time, speed_limit, average_speed, and standard_deviation of speed), and Correlations
-        which are indexed by edge_id
+        Graphs are written in 3 sections: Vertices (which has id, lat, and long), Edges (which have first_vertex id,
+        second_vertex id, distance, average_time, standard_deviation of time, speed_limit, average_speed,
+        standard_deviation of speed, and edge_id), and Correlations which are indexed by edge_id
+        The file is written one line at a time through a buffer, so the whole file is never held in memory
         :param file_name: the name of the file to be written out
+        :param OPTIONAL correlation_file: if given, the correlations are written to this .npy file so that they can be
+        memory-mapped by read_graph, instead of being written as a block of text
         :return: None
         """
-        with open(file_name, 'w+') as write_file:
-            output_string = "VERTICES" + '\n'
-            number_vertices = self.get_num_vertices()
-            for i in range(number_vertices):
-                current_vertex = self.vertices[i]
-                output_string += str(current_vertex.get_identifier())
-                output_string += ","
-                output_string += str(current_vertex.get_latitude())
-                output_string += ","
-                output_string += str(current_vertex.get_longitude())
-                output_string += '\n'
-            output_string += '\n'
-            output_string += '\n'
-            output_string += "EDGES"
-            output_string += '\n'
-            out_edges = sorted(self.edges.values())
-            for edge in out_edges:
-                output_string += str(edge.first_vertex)  # casting a vert to a string casts the vert's id to a string
-                output_string += ','
-                output_string += str(edge.second_vertex)
-                output_string += ','
-                output_string += str(edge.average_time)
-                output_string += ','
-                output_string += str(edge.speed_limit)
-                output_string += ','
-                output_string += str(edge.average_speed)
-                output_string += ','
-                output_string += str(edge.standard_deviation_speed)
-                output_string += '\n'
-            output_string += "CORRELATIONS"
-            output_string += '\n'
-            for edge_list in self.edge_correlation:
-                for value in edge_list:
-                    output_string += str(value)
-                    output_string += ','
-                output_string += '\n'
-            write_file.write(output_string)
+        with open(file_name, 'w+', buffering=GRAPH_FILE_BUFFER) as write_file:
+            write_file.writelines(self.graph_lines(include_correlations=correlation_file is None))
+        if correlation_file is not None:
+            self.write_correlations(correlation_file)
+
+    @staticmethod
+    def read_binary(file_name, correlation_file=None):
+        """
+        Reads in a graph stored in the binary format written by write_binary
+        Every field is read back as a flat array, so the graph is put back together without recalculating its speeds,
+        travel times, correlations, or jams
+        :param file_name: the path to a file written by write_binary
+        :param OPTIONAL correlation_file: the path to a .npy file written by write_binary, if given the correlations are
+        memory-mapped from it
+        :return: a Graph object
+        """
+        global edge_identifier_iterator
+        with numpy.load(file_name) as data:
+            arrays = {name: data[name] for name in data.files}
+
+        graph = Graph.__new__(Graph)
+        graph.clear_colors()
+        graph.deadline = None
+        graph.max_speed_limit = None
+        graph.landmarks = None
+        graph.hierarchy = None
+        graph.version = 0
+        hops = int(arrays['correlation_hops'])
+        graph.correlation_hops = hops if hops >= 0 else None
+
+        vertices = [Vertex(identifier, latitude, longitude) for identifier, latitude, longitude in
+                    zip(arrays['vertex_ids'].tolist(), arrays['latitudes'].tolist(), arrays['longitudes'].tolist())]
+        targets = arrays['targets'].tolist()
+        offsets = arrays['offsets'].tolist()
+        # NaN marks a value that was None when the graph was written
+        columns = [[None if value != value else value for value in arrays[name].tolist()]
+                   for name in BINARY_EDGE_COLUMNS]
+        edges = []
+        for vertex_index in range(len(vertices)):
+            first_vertex = vertices[vertex_index]
+            for position in range(offsets[vertex_index], offsets[vertex_index + 1]):
+                edges.append(Edge(first_vertex, vertices[targets[position]],
+                                  *[column[position] for column in columns]))
+        for edge, identifier in zip(edges, arrays['edge_ids'].tolist()):
+            edge.identifier = identifier
+        graph.index_edges(edges)
+        # the edges keep their written identifiers, so the next edges made are numbered from 0 as for a new graph
+        edge_identifier_iterator = 0
+
+        num_edges = int(arrays['num_edge_ids'])
+        if correlation_file is not None:
+            graph.edge_correlation = open_correlation_file(correlation_file)
+        elif bool(arrays['lazy_correlations']):
+            graph.edge_correlation = LazyCorrelations(graph, num_edges, graph.correlation_hops,
+                                                      float(arrays['correlation_epsilon']),
+                                                      int(arrays['correlation_cache_size']))
+        elif 'correlation_values' in arrays:
+            graph.edge_correlation = SparseCorrelations(num_edges, float(arrays['correlation_epsilon']))
+            correlation_offsets = arrays['correlation_offsets'].tolist()
+            correlation_columns = arrays['correlation_columns'].tolist()
+            correlation_values = arrays['correlation_values'].tolist()
+            for edge_id in range(num_edges):
+                start, end = correlation_offsets[edge_id], correlation_offsets[edge_id + 1]
+                if start != end:
+                    dict.update(graph.edge_correlation.row(edge_id),
+                                zip(correlation_columns[start:end], correlation_values[start:end]))
+        elif 'correlations' in arrays:
+            graph.edge_correlation = arrays['correlations']
+        else:
+            graph.edge_correlation = []
+
+        if 'landmark_forward' in arrays:
+            graph.landmarks = Landmarks.from_arrays(arrays, vertices)
+        if 'hierarchy_rank' in arrays:
+            graph.hierarchy = ContractionHierarchy.from_arrays(arrays, vertices)
+
+        edges_by_id = {edge.identifier: edge for edge in edges}
+        jam_ids = arrays['jams'].tolist()
+        # graphs written before multipliers were kept were all jammed by 2
+        jam_multipliers = arrays['jam_multipliers'].tolist() if 'jam_multipliers' in arrays else [2] * len(jam_ids)
+        graph.jams = set(edges_by_id[identifier] for identifier in jam_ids)
+        graph.jam_multipliers = {edges_by_id[identifier]: multiplier
+                                 for identifier, multiplier in zip(jam_ids, jam_multipliers)}
+        graph.jam_random = Random()
+        if 'jam_random_state' in arrays:
+            # picks up the random number generator where it was written, so the same jams are picked next
+            gauss = float(arrays['jam_random_gauss'])
+            graph.jam_random.setstate((int(arrays['jam_random_version']),
+                                       tuple(arrays['jam_random_state'].tolist()),
+                                       None if numpy.isnan(gauss) else gauss))
+        if 'open_edges' in arrays:
+            graph.set_open_edges(edges_by_id[identifier] for identifier in arrays['open_edges'].tolist())
+        else:
+            graph.set_open_edges(edge for edge in edges if edge not in graph.jams)
+        graph.clear_jam_influence()
+        graph.pending_jams = list(graph.jam_multipliers)
+        return graph
+
+    def write_binary(self, file_name, correlation_file=None, include_correlations=True):
+        """
+        Writes a graph to a binary file of flat arrays, so that it can be quickly retrieved later by read_binary
+        The vertices are written as id, latitude, and longitude arrays, the edges are written in compressed sparse row
+        order (offsets into a targets array for each vertex) alongside a column for each of the edge's values
+        The jams, correlations, landmarks, and hierarchy are written as they are, so the graph can be read back
+        without recalculating them, along with the edges that aren't jammed and the state of the random number
+        generator, so that the same jams are picked next
+        :param file_name: the name of the file to be written out
+        :param OPTIONAL correlation_file: if given, dense correlations are written to this .npy file so that they can be
+        memory-mapped by read_binary, instead of being written into the binary file
+        :param OPTIONAL include_correlations: if False, no correlations are written
+        :return: None
+        """
+        csr = CSRGraph.from_graph(self)
+        out_edges = [self.edges[(csr.vertices[source], csr.vertices[target])] for source, target in
+                     zip(csr.edge_sources().tolist(), csr.targets.tolist())]
+        random_version, random_state, random_gauss = self.jam_random.getstate()
+
+        arrays = {
+            'vertex_ids': numpy.array([vertex.get_identifier() for vertex in csr.vertices], dtype=numpy.int64),
+            'latitudes': numpy.array([vertex.get_latitude() for vertex in csr.vertices], dtype=numpy.float64),
+            'longitudes': numpy.array([vertex.get_longitude() for vertex in csr.vertices], dtype=numpy.float64),
+            'offsets': csr.offsets,
+            'targets': csr.targets,
+            'edge_ids': csr.edge_ids,
+            # the jams are written in the order they were jammed, so record_jams gives the same scenario once read
+            'jams': numpy.array([jam.identifier for jam in self.jam_multipliers], dtype=numpy.int64),
+            'jam_multipliers': numpy.array(list(self.jam_multipliers.values()), dtype=numpy.float64),
+            'open_edges': numpy.array([edge.identifier for edge in self.open_edges], dtype=numpy.int64),
+            'jam_random_version': numpy.int64(random_version),
+            'jam_random_state': numpy.array(random_state, dtype=numpy.int64),
+            # a missing gaussian is written as NaN, the same as a missing edge value
+            'jam_random_gauss': numpy.float64(numpy.nan if random_gauss is None else random_gauss),
+            'num_edge_ids': numpy.int64(len(self.edge_correlation) or self.get_num_edges()),
+            'correlation_hops': numpy.int64(-1 if self.correlation_hops is None else self.correlation_hops),
+            'lazy_correlations': numpy.bool_(isinstance(self.edge_correlation, LazyCorrelations)),
+            'correlation_epsilon': numpy.float64(getattr(self.edge_correlation, 'epsilon', 0.0)),
+            'correlation_cache_size': numpy.int64(getattr(self.edge_correlation, 'cache_size', 0)),
+        }
+        for name in BINARY_EDGE_COLUMNS:
+            # None can't be held by a float array, so it is written as NaN
+            arrays[name] = numpy.array([numpy.nan if getattr(edge, name) is None else getattr(edge, name)
+                                        for edge in out_edges], dtype=numpy.float64)
+
+        if self.landmarks is not None:
+            arrays.update(self.landmarks.to_arrays())
+        if self.hierarchy is not None:
+            arrays.update(self.hierarchy.to_arrays())
+
+        if correlation_file is not None:
+            self.write_correlations(correlation_file)
+        elif include_correlations and isinstance(self.edge_correlation, SparseCorrelations):
+            correlation_offsets = [0]
+            correlation_columns = []
+            correlation_values = []
+            for row in self.edge_correlation:
+                for column in sorted(row):
+                    correlation_columns.append(column)
+                    correlation_values.append(row[column])
+                correlation_offsets.append(len(correlation_columns))
+            arrays['correlation_offsets'] = numpy.array(correlation_offsets, dtype=numpy.int64)
+            arrays['correlation_columns'] = numpy.array(correlation_columns, dtype=numpy.int64)
+            arrays['correlation_values'] = numpy.array(correlation_values, dtype=numpy.float32)
+        elif include_correlations and not isinstance(self.edge_correlation, LazyCorrelations) and \
+                len(self.edge_correlation):
+            arrays['correlations'] = numpy.asarray(self.edge_correlation, dtype=numpy.float32)
+
+        with open(file_name, 'wb') as write_file:
+            numpy.savez(write_file, **arrays)
+
+    def build_landmarks(self, count=8, weight="distance", method="farthest"):
+        """
+        Picks landmark vertices and stores the distances to and from each of them, for use by landmark_goal_bound
+        The bounds stay valid while edge weights only go up, so landmarks should be built again after jams are cleared
+        :param count: the number of landmarks to pick, an int
+        :param weight: the edge weight the distances are measured in, "distance" or "average_time"
+        :param method: how landmarks are picked, "farthest" (farthest point) or "coordinates" (spread around the center)
+        :return: the Landmarks object, which is also kept in self.landmarks
+        """
+        self.landmarks = Landmarks.build(self, count, weight, method)
+        return self.landmarks
+
+    def build_hierarchy(self, weight="average_time"):
+        """
+        Contracts the graph into a hierarchy of shortcut edges, for use by hierarchy_search
+        The hierarchy is built on the edge weights as they are, so it should be built again after jams or edge weights
+        change
+        :param weight: the edge weight the hierarchy is built on, "distance" or "average_time"
+        :return: the ContractionHierarchy object, which is also kept in self.hierarchy
+        """
+        self.hierarchy = ContractionHierarchy.build(self, weight)
+        return self.hierarchy
+
+    def to_csr(self):
+        """
+        Creates the compact, read-only CSR representation of the graph used by the array based search algorithms
+        It is a snapshot, so it has to be made again after jams or edge weights change
+        :return: a CSRGraph object
+        """
+        return CSRGraph.from_graph(self)
+
+    def write_correlations(self, correlation_file):
+        """
+        Writes the correlations out to a .npy file that can be memory-mapped by read_graph
+        If the correlations are already memory-mapped to that file, they are just flushed
+        :param correlation_file: the path to the .npy file
+        :return: None
+        """
+        mapped_file = getattr(self.edge_correlation, 'filename', None)
+        if mapped_file is not None and abspath(mapped_file) == abspath(correlation_file):
+            if self.edge_correlation.mode != 'r':
+                self.edge_correlation.flush()
+            return
+        write_correlation_file(self.edge_correlation, correlation_file)
 
     def get_num_vertices(self):
         """
@@ -607,6 +1085,14 @@ class Graph:
         """
         return max(self.vertices.keys()) + 1
 
+    def get_num_edges(self):
+        """
+        Gets the number of edge identifiers in the graph, used to size the correlations
+        Edge identifiers can skip values when parsed edges replace each other, so taking the max works for this
+        :return: an int, the number of edge identifiers
+        """
+        return max((self.edges[edge].identifier for edge in self.edges), default=-1) + 1
+
     def set_deadline(self, d):
         """
         Set the target deadline value of the Graph to be used in Dijkstra heuristics like normal_dist_traffic heuristic
@@ -674,6 +1160,27 @@ class Vertex:
 
 edge_identifier_iterator = 0  # used to auto_increment edges, has to maintain state so will be global
 
+DEFAULT_SPEED_LIMIT = 40  # the speed limit of roads that aren't connected to any road with a speed limit
+GRAPH_FILE_SECTIONS = ("VERTICES", "EDGES", "CORRELATIONS")  # the headers of the blocks in a graph .txt file
+GRAPH_FILE_BUFFER = 1 << 20  # the size of the buffer used to stream graph .txt files, in bytes
+
+
+def parse_number(value):
+    """
+    Parses a number written in a graph .txt file, keeping whole numbers as ints
+    :param value: the string to be parsed
+    :return: an int if the value is a whole number, a float otherwise
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+# the edge fields written by write_binary, in the order of the Edge constructor's arguments
+BINARY_EDGE_COLUMNS = ('distance', 'average_time', 'standard_deviation_time', 'speed_limit', 'average_speed',
+                       'standard_deviation_speed')
+
 
 class Edge:
     """
@@ -1,10 +1,8 @@
 """
 Generates and displays a networkx graph to an html file using plotly
 Based off of code found here: https://plot.ly/python/network-graphs/
+plotly and networkx are slow to import, so they are only imported by the functions that use them
 """
-import plotly
-import plotly.graph_objs as go
-import networkx as nx
 from sys import maxsize
 
 
@@ -18,6 +16,7 @@ def generate_graph(graph):
     :param graph: a Graph.py representation of a graph
     :return: a networkx representation of graph, scaled and translated
     """
+    import networkx as nx
     g = nx.Graph()
     pos = {}
     min_latitude = maxsize
@@ -62,6 +61,8 @@ def draw_graph(graph, title, filename):
     :param title: the title to display above the graph
     :param filename: the name to save the HTML file as in nav-research/graph_displays/generated/
     """
+    import plotly
+    import plotly.graph_objs as go
     # graph = generate_graph(graph)
 
     edge_trace = []
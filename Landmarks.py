@@ -0,0 +1,150 @@
+"""
+Houses the landmark preprocessing used by A* with landmarks (ALT)
+The distances to and from a few landmark vertices give lower bounds on the distance between any two vertices through
+the triangle inequality, which are much tighter than geometric bounds on road graphs with one-way edges
+"""
+import numpy
+from math import atan2, pi
+from CSRGraph import CSRGraph
+
+
+class Landmarks:
+    """
+    Landmarks Class
+    :field weight: the name of the edge weight the distances are measured in, "distance" or "average_time"
+    :field vertices: a list of vertex objects, ordered by the index used in the distance arrays
+    :field vertex_index: a hash of vertex object to its index in the distance arrays
+    :field landmarks: a list of the indices of the landmark vertices
+    :field forward: a numpy float array of shape (landmarks, vertices), the distance from each landmark to each vertex
+    :field reverse: a numpy float array of shape (landmarks, vertices), the distance from each vertex to each landmark
+    """
+    weight = None
+    vertices = []
+    vertex_index = {}
+    landmarks = []
+    forward = None
+    reverse = None
+
+    def __init__(self, weight, vertices, landmarks, forward, reverse):
+        """
+        Constructor for the Landmarks Class
+        :param weight: the name of the edge weight the distances are measured in
+        :param vertices: a list of vertex objects, ordered by the index used in the distance arrays
+        :param landmarks: a list of the indices of the landmark vertices
+        :param forward: a numpy float array of shape (landmarks, vertices), the distances from each landmark
+        :param reverse: a numpy float array of shape (landmarks, vertices), the distances to each landmark
+        """
+        self.weight = weight
+        self.vertices = vertices
+        self.vertex_index = {vertex: index for index, vertex in enumerate(vertices)}
+        self.landmarks = landmarks
+        self.forward = forward
+        self.reverse = reverse
+
+    @staticmethod
+    def build(graph, count=8, weight="distance", method="farthest"):
+        """
+        Picks landmark vertices and finds the distances to and from each of them
+        The bounds stay valid while edge weights only go up (such as when jams are added), so landmarks should be built
+        again after jams are cleared
+        :param graph: the Graph object to build landmarks for
+        :param count: the number of landmarks to pick, an int
+        :param weight: the name of the edge weight to measure distances in, "distance" or "average_time"
+        :param method: "farthest" to repeatedly pick the vertex farthest from the landmarks picked so far, or
+        "coordinates" to pick the vertex farthest from the center in each of count equal slices around it
+        :return: a Landmarks object
+        """
+        csr = CSRGraph.from_graph(graph)
+        reverse_csr = csr.reversed()
+        count = min(count, csr.get_num_vertices())
+        if method == "coordinates":
+            landmarks = Landmarks.coordinate_landmarks(csr.vertices, count)
+        elif method == "farthest":
+            landmarks = []
+            # the first landmark is the vertex farthest from vertex 0
+            spread = csr.distances_from(0, weight) if count else None
+        else:
+            raise ValueError("Unknown landmark method: " + str(method))
+
+        forward = []
+        reverse = []
+        while len(forward) < (count if method == "farthest" else len(landmarks)):
+            if method == "farthest":
+                # pick the reachable vertex farthest from every landmark picked so far
+                candidates = numpy.where(numpy.isfinite(spread), spread, -1)
+                candidates[landmarks] = -1
+                landmarks.append(int(numpy.argmax(candidates)))
+            landmark = landmarks[len(forward)]
+            forward.append(csr.distances_from(landmark, weight))
+            reverse.append(reverse_csr.distances_from(landmark, weight))
+            if method == "farthest":
+                spread = forward[-1] if len(forward) == 1 else numpy.minimum(spread, forward[-1])
+        num_vertices = csr.get_num_vertices()
+        return Landmarks(weight, csr.vertices, landmarks, numpy.array(forward).reshape(-1, num_vertices),
+                         numpy.array(reverse).reshape(-1, num_vertices))
+
+    @staticmethod
+    def coordinate_landmarks(vertices, count):
+        """
+        Picks landmarks spread evenly around a graph by their coordinates
+        The vertices are split into count equal slices by their angle around the center of the graph, and the vertex
+        farthest from the center in each slice is picked
+        :param vertices: a list of vertex objects
+        :param count: the number of landmarks to pick, an int
+        :return: a list of the indices of the picked vertices
+        """
+        center_latitude = sum(vertex.get_latitude() for vertex in vertices) / len(vertices)
+        center_longitude = sum(vertex.get_longitude() for vertex in vertices) / len(vertices)
+        farthest = {}  # slice number to (distance from center, vertex index)
+        for index, vertex in enumerate(vertices):
+            delta_latitude = vertex.get_latitude() - center_latitude
+            delta_longitude = vertex.get_longitude() - center_longitude
+            angle = atan2(delta_latitude, delta_longitude) + pi
+            part = min(int(angle / (2 * pi) * count), count - 1)
+            distance = delta_latitude ** 2 + delta_longitude ** 2
+            if part not in farthest or distance > farthest[part][0]:
+                farthest[part] = (distance, index)
+        return [farthest[part][1] for part in sorted(farthest)]
+
+    def lower_bound(self, vertex, dest):
+        """
+        Finds a lower bound on the distance from vertex to dest using the triangle inequality at each landmark
+        d(vertex, dest) >= d(landmark, dest) - d(landmark, vertex) and d(vertex, dest) >= d(vertex, landmark) -
+        d(dest, landmark)
+        :param vertex: the vertex object to measure from
+        :param dest: the vertex object to measure to
+        :return: a lower bound on the distance, a float (inf if dest can't be reached from vertex)
+        """
+        i = self.vertex_index[vertex]
+        j = self.vertex_index[dest]
+        with numpy.errstate(invalid='ignore'):
+            # a landmark that reaches neither vertex gives inf - inf, which is nan and ignored
+            bounds = numpy.concatenate((self.forward[:, j] - self.forward[:, i],
+                                        self.reverse[:, i] - self.reverse[:, j]))
+        bounds = bounds[~numpy.isnan(bounds)]
+        if not len(bounds):
+            return 0
+        return max(float(bounds.max()), 0)
+
+    def to_arrays(self):
+        """
+        Gets the landmarks as flat arrays, so they can be written with the graph by Graph.write_binary
+        :return: a hash of array name to numpy array
+        """
+        return {
+            'landmark_weight': numpy.array(self.weight),
+            'landmark_indices': numpy.array(self.landmarks, dtype=numpy.int64),
+            'landmark_forward': self.forward,
+            'landmark_reverse': self.reverse,
+        }
+
+    @staticmethod
+    def from_arrays(arrays, vertices):
+        """
+        Creates landmarks from the flat arrays written by to_arrays
+        :param arrays: a hash of array name to numpy array
+        :param vertices: a list of vertex objects, in the same order as when the landmarks were written
+        :return: a Landmarks object
+        """
+        return Landmarks(str(arrays['landmark_weight']), vertices, arrays['landmark_indices'].tolist(),
+                         arrays['landmark_forward'], arrays['landmark_reverse'])
@@ -1,6 +1,13 @@
 import xml.etree.ElementTree as elementTree
 from Graph import Graph, Vertex, Edge
+from Correlations import SparseCorrelations, LazyCorrelations
 from math import radians, sin, cos, asin, sqrt
+import numpy
+from hashlib import sha256
+from os import makedirs, replace
+from os.path import join, exists
+
+OSM_CACHE_VERSION = 3  # bump whenever a change to parsing or Graph construction changes the graphs that are built
 
 
 def haversine(vertex1, vertex2):
@@ -22,6 +29,71 @@ def haversine(vertex1, vertex2):
     return earth_radius * c
 
 
+def haversine_radians(lat1, cos_lat1, lat2, cos_lat2, delta_long):
+    """
+    Calculates the distance in kilometers between GPS coordinates that are already in radians using the Haversine
+    formula.
+    Works on floats or on whole numpy arrays of coordinates at once, and takes the cosine of each latitude so that it
+    only has to be calculated once for a vertex that is shared by many segments.
+    :param lat1: the latitude of the first coordinates, in radians
+    :param cos_lat1: the cosine of lat1
+    :param lat2: the latitude of the second coordinates, in radians
+    :param cos_lat2: the cosine of lat2
+    :param delta_long: the longitude of the second coordinates minus the longitude of the first, in radians
+    :return: the distance in kilometers between the coordinates, a float or numpy array
+    """
+    earth_radius = 6372.8  # Earth radius in kilometers
+    a = numpy.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * numpy.sin(delta_long / 2) ** 2
+    c = 2 * numpy.arcsin(numpy.sqrt(a))
+    return earth_radius * c
+
+
+def segment_lengths(segments):
+    """
+    Calculates the haversine distance of every segment in a single numpy pass.
+    The radians and cosine of each vertex's latitude are calculated once, no matter how many segments share it.
+    :param segments: a list of segments, whose first two entries are the vertices at either end of the segment
+    :return: a numpy array of the distance in kilometers of each segment
+    """
+    vertex_index = {}  # the id of a vertex object to its position in the coordinate lists
+    latitudes = []
+    longitudes = []
+    ends = ([], [])
+    for segment in segments:
+        for vertex, end in zip(segment[:2], ends):
+            key = id(vertex)
+            if key not in vertex_index:
+                vertex_index[key] = len(latitudes)
+                latitudes.append(vertex.get_latitude())
+                longitudes.append(vertex.get_longitude())
+            end.append(vertex_index[key])
+
+    latitudes = numpy.radians(numpy.array(latitudes, dtype=numpy.float64))
+    longitudes = numpy.array(longitudes, dtype=numpy.float64)
+    cos_latitudes = numpy.cos(latitudes)
+    first = numpy.array(ends[0], dtype=numpy.int64)
+    second = numpy.array(ends[1], dtype=numpy.int64)
+    # the longitudes are subtracted before being converted, the same as haversine() does
+    return haversine_radians(latitudes[first], cos_latitudes[first], latitudes[second], cos_latitudes[second],
+                             numpy.radians(longitudes[second] - longitudes[first]))
+
+
+def create_edges(segments):
+    """
+    Creates the edges for every segment found while parsing, with all of their distances calculated at once.
+    :param segments: a list of (first_vertex, second_vertex, speed_limit, two_way) segments, in the order they were
+    parsed. Two way segments also get an edge from second_vertex to first_vertex.
+    :return: a list of edges, in the same order the segments were parsed
+    """
+    edges = []
+    for (first_vertex, second_vertex, speed_limit, two_way), distance in \
+            zip(segments, segment_lengths(segments).tolist()):
+        edges.append(Edge(first_vertex, second_vertex, distance, speed_limit=speed_limit))
+        if two_way:
+            edges.append(Edge(second_vertex, first_vertex, distance, speed_limit=speed_limit))
+    return edges
+
+
 def valid_feature(tags):
     """
     Determines if the feature represented by the given tags is valid, i.e. a road
@@ -70,119 +142,258 @@ def max_speed(tags):
     return 0
 
 
-def parse_osm(path):
+def iterate_osm(path):
     """
-    Given a path to an OSM extract, read the file line by line and construct a graph from nodes and ways (edges).
+    Streams the nodes, ways, and relations of an OSM extract one element at a time using incremental parsing.
+    Each element is cleared as soon as it has been processed, so the whole XML tree is never held in memory.
     :param path: a path to an .osm file relative to this file.
-    :return: A Graph.py representation of a graph.
+    :return: a generator of the node, way, and relation elements in the order they appear in the file.
     """
-    vertices = {}
-    edges = []
-    ways = {}
+    context = elementTree.iterparse(path, events=("start", "end"))
+    _, root = next(context)  # the first event is the start of the root osm element
+    for event, child in context:
+        if event == "end" and child.tag in ("node", "way", "relation"):
+            yield child
+            # drop the processed element, and the root's reference to it, so memory stays flat
+            child.clear()
+            root.clear()
 
-    root = elementTree.parse(path).getroot()
-    for child in root:
 
-        if child.tag == "node":
-            # A list of all of the metadata of this node that is used to filter out unwanted nodes and store metadata
-            tags = child.findall('tag')
+def road_node_ids(path):
+    """
+    Streams through an OSM extract to find the ids of every node that a road (a valid way or relation) references.
+    :param path: a path to an .osm file relative to this file.
+    :return: a set of node ids (strings, as they appear in the file)
+    """
+    node_ids = set()
+    for child in iterate_osm(path):
+        if child.tag == "way":
+            if valid_feature(child.findall('tag')):
+                node_ids.update(node.attrib['ref'] for node in child.findall('nd'))
+        elif child.tag == "relation":
+            if valid_feature(child.findall('tag')):
+                node_ids.update(member.attrib['ref'] for member in child.findall('member')
+                                if member.attrib['type'] == 'node')
+    return node_ids
 
-            if not valid_feature(tags):
-                continue
 
-            attribs = child.attrib
-            vert = Vertex(int(attribs['id']), float(attribs['lat']), float(attribs['lon']))
-            vertices[attribs['id']] = vert
+def parse_node(child, vertices, node_ids=None):
+    """
+    Creates a vertex from an OSM node element and adds it to vertices, unless the node is filtered out.
+    :param child: a node element
+    :param vertices: a dictionary of node id to vertex, the vertex is added to it
+    :param node_ids: if given, a set of node ids to keep, any other node is skipped
+    :return: None
+    """
+    attribs = child.attrib
+    if node_ids is not None and attribs['id'] not in node_ids:
+        return
 
-            # Iterate through the tags of each node to parse its associated metadata
-            # for tag in tags:
-            #     print(tag.tag, tag.attrib)
+    # A list of all of the metadata of this node that is used to filter out unwanted nodes and store metadata
+    tags = child.findall('tag')
 
-        elif child.tag == "way":
-            # A list of ids of nodes in this way
-            nds = child.findall('nd')
-            # A list of all of the metadata of this way that is used to filter out unwanted ways and store metadata
-            tags = child.findall('tag')
-            # Boolean flag to handle two-way edge flipping.
-            oneway = is_oneway(tags)
-            # The speed limit of the way, or 0 if there is not one specified
-            speed = max_speed(tags)
-
-            if not valid_feature(tags):
-                continue
-
-            prev_vertex = None
-            first_vertex = None
-            for node in nds:
-                ''' 
-                There can be nodes that were filtered out already still in these ways, so if they are not in the
-                vertices dictionary, we'll need to skip them. 
-                For example if a road and a railway intersect, the point at which they intersect could still be
-                in a way representing a road, even though it's a railway node.
-                '''
-                if node.attrib['ref'] not in vertices:
-                    continue
-
-                vertex = vertices[node.attrib['ref']]
-                if prev_vertex:
-                    # The haversine distance between the two vertexes
-                    distance = abs(haversine(prev_vertex, vertex))
-                    edges.append(Edge(prev_vertex, vertex, distance, speed))
-
-                    # If the way is one-way, flip the edge and append it
-                    if not oneway:
-                        edges.append(Edge(vertex, prev_vertex, distance, speed))
-                else:
-                    first_vertex = vertex
+    if not valid_feature(tags):
+        return
+
+    vert = Vertex(int(attribs['id']), float(attribs['lat']), float(attribs['lon']))
+    vertices[attribs['id']] = vert
+
+    # Iterate through the tags of each node to parse its associated metadata
+    # for tag in tags:
+    #     print(tag.tag, tag.attrib)
+
+
+def parse_way(child, vertices, segments, ways):
+    """
+    Finds the segments between the consecutive vertices of an OSM way element.
+    :param child: a way element
+    :param vertices: a dictionary of node id to vertex
+    :param segments: a list of segments to be turned into edges by create_edges, the way's segments are appended to it
+    :param ways: a dictionary of way id to the (first, last) vertices of the way, the way is added to it
+    :return: None
+    """
+    # A list of ids of nodes in this way
+    nds = child.findall('nd')
+    # A list of all of the metadata of this way that is used to filter out unwanted ways and store metadata
+    tags = child.findall('tag')
+    # Boolean flag to handle two-way edge flipping.
+    oneway = is_oneway(tags)
+    # The speed limit of the way, or 0 if there is not one specified
+    speed = max_speed(tags)
+
+    if not valid_feature(tags):
+        return
+
+    prev_vertex = None
+    first_vertex = None
+    for node in nds:
+        ''' 
+        There can be nodes that were filtered out already still in these ways, so if they are not in the
+        vertices dictionary, we'll need to skip them. 
+        For example if a road and a railway intersect, the point at which they intersect could still be
+        in a way representing a road, even though it's a railway node.
+        '''
+        if node.attrib['ref'] not in vertices:
+            continue
+
+        vertex = vertices[node.attrib['ref']]
+        if prev_vertex:
+            # The haversine distance between the two vertexes is found later, along with every other segment's
+            # If the way is not one-way, the edge is also flipped and appended
+            segments.append((prev_vertex, vertex, speed, not oneway))
+        else:
+            first_vertex = vertex
+        prev_vertex = vertex
+
+    ways[child.attrib['id']] = (first_vertex, prev_vertex)  # store the first and last vertex of the way
+
+    # Iterate through the tags of each way to parse its associated metadata
+    # for tag in tags:
+    #     print(tag.tag, tag.attrib)
+
+
+def parse_relation(child, vertices, segments, ways):
+    """
+    Finds the segments that join the members of an OSM relation element end to end.
+    :param child: a relation element
+    :param vertices: a dictionary of node id to vertex
+    :param segments: a list of segments to be turned into edges by create_edges, the relation's segments are appended
+    to it
+    :param ways: a dictionary of way id to the (first, last) vertices of the way
+    :return: None
+    """
+    # A list of ids of members (either ways or nodes) in this relation
+    members = child.findall('member')
+    # A list of all of the metadata of this relation that is used to filter out unwanted ways and store metadata
+    tags = child.findall('tag')
+
+    if not valid_feature(tags):
+        return
+
+    prev_vertex = None
+    for member in members:
+        mem_type = member.attrib['type']
+        mem_id = member.attrib['ref']
+        ''' 
+        There can be nodes that were filtered out already still in these ways, so if they are not in the
+        vertices dictionary, we'll need to skip them. 
+        For example if a road and a railway intersect, the point at which they intersect could still be
+        in a way representing a road, even though it's a railway node.
+        '''
+        if mem_id not in vertices and mem_id not in ways:
+            continue
+
+        if prev_vertex:
+            if mem_type in ['way']:
+                way = ways[mem_id]
+                segments.append((prev_vertex, way[0], None, False))
+                prev_vertex = way[1]
+
+            elif mem_type in ['node']:
+                vertex = vertices[mem_id]
+                segments.append((prev_vertex, vertex, None, False))
                 prev_vertex = vertex
+        else:
+            if mem_type in ['way']:
+                prev_vertex = ways[mem_id][1]
+            elif mem_type in ['node']:
+                prev_vertex = vertices[mem_id]
+
+    # Iterate through the tags of each relation to parse its associated metadata
+    # for tag in tags:
+    #     print(tag.tag, tag.attrib)
 
-            ways[child.attrib['id']] = (first_vertex, prev_vertex)  # store the first and last vertex of the way
 
-            # Iterate through the tags of each way to parse its associated metadata
-            # for tag in tags:
-            #     print(tag.tag, tag.attrib)
+def osm_cache_key(path, settings):
+    """
+    Finds the key that a graph built from an OSM extract is cached under.
+    The key is a hash of the contents of the extract along with the settings used to build the graph, so editing
+    either one leads to a new key.
+    :param path: a path to an .osm file relative to this file.
+    :param settings: a dictionary of the settings that the graph is built with
+    :return: the key, a string of hex digits
+    """
+    key = sha256()
+    with open(path, 'rb') as osm_file:
+        for chunk in iter(lambda: osm_file.read(1 << 20), b''):
+            key.update(chunk)
+    key.update(repr((OSM_CACHE_VERSION, sorted(settings.items()))).encode())
+    return key.hexdigest()
+
+
+def read_cached_osm(cache_dir, key):
+    """
+    Reads a graph that was cached by write_cached_osm.
+    :param cache_dir: the directory the graph was cached in
+    :param key: the key the graph was cached under, from osm_cache_key
+    :return: the cached Graph.py representation of a graph, or None if nothing is cached under key
+    """
+    graph_file = join(cache_dir, key + ".graph")
+    if not exists(graph_file):
+        return None
+    correlation_file = join(cache_dir, key + ".npy")
+    return Graph.read_binary(graph_file, correlation_file if exists(correlation_file) else None)
 
+
+def write_cached_osm(graph, cache_dir, key):
+    """
+    Caches a fully built graph in the binary graph format, so that it can later be read by read_cached_osm.
+    Dense correlations are written to their own .npy file so that they are memory-mapped when they are read.
+    :param graph: the Graph.py representation of a graph to be cached
+    :param cache_dir: the directory to cache the graph in, it is created if it doesn't exist
+    :param key: the key to cache the graph under, from osm_cache_key
+    :return: None
+    """
+    makedirs(cache_dir, exist_ok=True)
+    graph_file = join(cache_dir, key + ".graph")
+    correlation_file = None
+    if not isinstance(graph.edge_correlation, (SparseCorrelations, LazyCorrelations)):
+        correlation_file = join(cache_dir, key + ".npy")
+        graph.write_correlations(correlation_file + ".tmp")
+        replace(correlation_file + ".tmp", correlation_file)
+    # write to a temporary file first, so that a half written graph is never read from the cache
+    graph.write_binary(graph_file + ".tmp", include_correlations=correlation_file is None)
+    replace(graph_file + ".tmp", graph_file)
+
+
+def parse_osm(path, stream=False, cache_dir=None, **graph_options):
+    """
+    Given a path to an OSM extract, read the file line by line and construct a graph from nodes and ways (edges).
+    :param path: a path to an .osm file relative to this file.
+    :param stream: if True, the extract is parsed incrementally in two passes instead of being loaded as a whole XML
+    tree. The first pass finds the nodes that roads reference and the second only keeps those nodes, so extracts much
+    larger than memory can be parsed.
+    :param cache_dir: if given, the fully built graph is cached in this directory, keyed by a hash of the extract and
+    graph_options. Later calls with the same extract and options read the cached graph instead of parsing it.
+    :param graph_options: keyword arguments passed on to the Graph constructor, such as correlation_hops
+    :return: A Graph.py representation of a graph.
+    """
+    if cache_dir is not None:
+        key = osm_cache_key(path, graph_options)
+        graph = read_cached_osm(cache_dir, key)
+        if graph is not None:
+            return graph
+
+    vertices = {}
+    segments = []
+    ways = {}
+
+    if stream:
+        node_ids = road_node_ids(path)
+        elements = iterate_osm(path)
+    else:
+        node_ids = None
+        elements = elementTree.parse(path).getroot()
+
+    for child in elements:
+        if child.tag == "node":
+            parse_node(child, vertices, node_ids)
+        elif child.tag == "way":
+            parse_way(child, vertices, segments, ways)
         elif child.tag == "relation":
-            # A list of ids of members (either ways or nodes) in this relation
-            members = child.findall('member')
-            # A list of all of the metadata of this relation that is used to filter out unwanted ways and store metadata
-            tags = child.findall('tag')
-
-            if not valid_feature(tags):
-                continue
-
-            prev_vertex = None
-            for member in members:
-                mem_type = member.attrib['type']
-                mem_id = member.attrib['ref']
-                ''' 
-                There can be nodes that were filtered out already still in these ways, so if they are not in the
-                vertices dictionary, we'll need to skip them. 
-                For example if a road and a railway intersect, the point at which they intersect could still be
-                in a way representing a road, even though it's a railway node.
-                '''
-                if mem_id not in vertices and mem_id not in ways:
-                    continue
-
-                if prev_vertex:
-                    if mem_type in ['way']:
-                        way = ways[mem_id]
-                        new_edge = Edge(prev_vertex, way[0], abs(haversine(prev_vertex, way[0])))
-                        edges.append(new_edge)
-                        prev_vertex = way[1]
-
-                    elif mem_type in ['node']:
-                        vertex = vertices[mem_id]
-                        new_edge = Edge(prev_vertex, vertex, abs(haversine(prev_vertex, vertex)))
-                        edges.append(new_edge)
-                        prev_vertex = vertex
-                else:
-                    if mem_type in ['way']:
-                        prev_vertex = ways[mem_id][1]
-                    elif mem_type in ['node']:
-                        prev_vertex = vertices[mem_id]
-
-            # Iterate through the tags of each relation to parse its associated metadata
-            # for tag in tags:
-            #     print(tag.tag, tag.attrib)
-    return Graph(edges)
+            parse_relation(child, vertices, segments, ways)
+    graph = Graph(create_edges(segments), **graph_options)
+
+    if cache_dir is not None:
+        write_cached_osm(graph, cache_dir, key)
+    return graph
@@ -0,0 +1,80 @@
+"""
+Houses a least recently used cache of routes that sits in front of a search algorithm
+Routes are only valid for the traffic they were found in, so the cache empties itself whenever the graph's version
+changes (jams being created or cleared, or edge weights changing)
+"""
+from collections import OrderedDict
+from SearchAlgorithms import dijkstra
+
+
+class RouteCache:
+    """
+    RouteCache Class
+    :field graph: the graph whose routes are cached
+    :field search: the search algorithm used on a miss, a function of (graph, src, dest, heuristic, deadline)
+    :field max_size: the max number of routes kept, an int
+    :field version: the graph version the cached routes were found in
+    :field routes: an OrderedDict of (src, dest, heuristic, deadline) to the route found, from least to most recently
+    used
+    :field hits: the number of lookups answered from the cache, an int
+    :field misses: the number of lookups that had to search, an int
+    """
+    graph = None
+    search = None
+    max_size = 0
+    version = None
+    routes = None
+    hits = 0
+    misses = 0
+
+    def __init__(self, graph, max_size=4096, search=dijkstra):
+        """
+        Constructor for the RouteCache Class
+        :param graph: the graph whose routes are cached
+        :param OPTIONAL max_size: the max number of routes kept, an int
+        :param OPTIONAL search: the search algorithm used on a miss, dijkstra if not given
+        """
+        self.graph = graph
+        self.search = search
+        self.max_size = max_size
+        self.version = graph.version
+        self.routes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def route(self, src, dest, heuristic, deadline=None):
+        """
+        Finds the route from src to dest, searching only if the same query hasn't been answered since the graph's
+        version last changed
+        A cached route doesn't mark vertices as seen in the graph, since no search is run for it
+        :param src: the source vertex to search from
+        :param dest: the destination vertex to search to
+        :param heuristic: the heuristic function used as a weight
+        :param deadline: the target deadline value used in heuristic functions
+        :return: a list which is the optimal path (in the same order as dijkstra), or None if dest can't be reached
+        """
+        if self.graph.version != self.version:
+            # the traffic changed, so none of the cached routes can be trusted
+            self.clear()
+        key = (src, dest, heuristic, deadline)
+        if key in self.routes:
+            self.routes.move_to_end(key)
+            self.hits += 1
+            path = self.routes[key]
+        else:
+            self.misses += 1
+            path = self.search(self.graph, src, dest, heuristic, deadline)
+            self.routes[key] = path
+            if len(self.routes) > self.max_size:
+                # throw out the least recently used route
+                self.routes.popitem(last=False)
+        # callers are free to change the list they are given, so the cached one is never handed out
+        return None if path is None else list(path)
+
+    def clear(self):
+        """
+        Clears the cached routes, and brings the cache up to the graph's current version
+        :return: None
+        """
+        self.routes.clear()
+        self.version = self.graph.version
@@ -2,10 +2,35 @@
 Created by Michael Bolot and John (Jack) Baumann for 2018-19 research
 Houses the search algorithms and heuristic functions to be run on a graph
 """
-from queue import PriorityQueue
+import numpy
+from heapq import heappush, heappop
+from OSMParser import haversine
+from CSRGraph import shortest_path
 from sys import maxsize
-from math import sqrt
-from scipy.stats import norm
+from math import sqrt, inf
+
+norm = None  # scipy.stats.norm, which is slow to import, so it is imported by normal_dist_traffic when first needed
+
+
+class PathParents(dict):
+    """
+    The parents hash used by the searches, a dict of vertex to its parent with respect to optimal path
+    It also keeps the running statistics of the path to each vertex, so that normal_dist_traffic only has to work out
+    the statistics for a vertex once instead of on every edge relaxation
+    :field stats: a hash of vertex to the statistics of the path to it, from path_statistics
+    """
+    stats = {}
+
+    def __init__(self):
+        """
+        Constructor for the PathParents Class
+        """
+        super().__init__()
+        self.stats = {}
+
+
+# the statistics of a path with no edges, see path_statistics
+EMPTY_PATH_STATISTICS = (None, 0, 0, None, 0, None)
 
 
 def path_distance(graph, path):
@@ -78,28 +103,132 @@ def dfs(graph, src, dest):
 
 def dijkstra(graph, src, dest, heuristic, deadline=None):
     """
+    Dijkstra's algorithm over a binary heap
+    Vertices are only given a distance once they are reached, stale heap entries are skipped once their vertex is
+    settled, and the search stops as soon as dest is settled, so the work done scales with the searched region
     :param graph: graph that will be used to find optimal path
     :param src: the source vertex to search from
     :param dest: the destination vertex to search to
     :param heuristic: the heuristic function used as a weight. Returns 0 for Djikstra's, and non-zero for a*
     :param deadline: the target deadline value used in heuristic functions
-    :return: a list which is the optimal path
+    :return: a list which is the optimal path, or None if dest can't be reached
     """
-    distance = {}  # the distance value of each vertex
-    parents = {}  # the parent of each vertex, with respect to optimal path
-    q = PriorityQueue()
     graph.set_deadline(deadline)
-    for vertex in graph.vertices:
-        added_vertex = graph.vertices[vertex]
-        if added_vertex == src:
-            distance[added_vertex] = 0
-            q.put((0, vertex))
+    distance, parents, settled = dijkstra_search(graph, src, (dest,), heuristic)
+    if dest not in settled:
+        return None
+    return reconstruct_path(parents, src, dest)
+
+
+def dijkstra_search(graph, src, targets, heuristic):
+    """
+    The search behind dijkstra and travel_time_matrix, which runs until every target is settled
+    A settled vertex's distance and parent never change, so each target ends up with the same path that dijkstra
+    would find for it alone
+    :param graph: graph that will be used to find optimal paths
+    :param src: the source vertex to search from
+    :param targets: the vertices to search to, an iterable
+    :param heuristic: the heuristic function used as a weight
+    :return: (distance, parents, settled), the hash of each reached vertex to its distance, the hash of each reached
+    vertex to its parent, and the set of settled vertices
+    """
+    distance = {src: 0}  # the distance value of each reached vertex
+    parents = PathParents()  # the parent of each reached vertex, with respect to optimal path
+    settled = set()  # the vertices whose optimal distance is known
+    remaining = set(targets)  # the targets that haven't been settled yet
+    # entries are (distance, identifier, vertex), the identifier breaks ties so vertices are never compared
+    q = [(0, src.get_identifier(), src)]
+
+    while q and remaining:
+        current_distance, _, current_vertex = heappop(q)
+        if current_vertex in settled:
+            # a shorter way to this vertex was already expanded, so this entry is stale
+            continue
+        settled.add(current_vertex)
+        remaining.discard(current_vertex)
+        if not remaining:
+            break
+        if current_vertex not in graph.connections:
             continue
-        distance[added_vertex] = maxsize
-        parents[added_vertex] = None
+        if current_vertex not in graph.seen:
+            graph.add_seen(current_vertex)
+        for connection in graph.connections[current_vertex]:
+            if connection in settled:
+                continue
+            best_move = current_distance + heuristic(graph, current_vertex, connection, parents)
+            if connection not in distance or best_move < distance[connection]:
+                distance[connection] = best_move
+                parents[connection] = current_vertex
+                heappush(q, (best_move, connection.get_identifier(), connection))
+    return distance, parents, settled
+
+
+def travel_time_matrix(graph, origins, destinations, heuristic=None, deadline=None, return_paths=False):
+    """
+    Finds the cost from every origin to every destination, with one search per origin instead of one per pair
+    Each search stops as soon as all of the destinations are settled, and the costs are the same as dijkstra's
+    :param graph: graph that will be used to find optimal paths
+    :param origins: a list of source vertices
+    :param destinations: a list of destination vertices
+    :param heuristic: the heuristic function used as a weight, travel_time_heuristic if not given
+    :param deadline: the target deadline value used in heuristic functions
+    :param return_paths: if True, the optimal paths are returned along with the costs
+    :return: a numpy float array of shape (len(origins), len(destinations)) of the cost of each pair, inf where the
+    destination can't be reached. If return_paths is True, (costs, paths) where paths[i][j] is the optimal path (in
+    the same order as dijkstra) from origins[i] to destinations[j], or None
+    """
+    if heuristic is None:
+        heuristic = travel_time_heuristic
+    graph.set_deadline(deadline)
+    costs = numpy.full((len(origins), len(destinations)), inf)
+    paths = []
+    for i, src in enumerate(origins):
+        distance, parents, settled = dijkstra_search(graph, src, destinations, heuristic)
+        origin_paths = []
+        for j, dest in enumerate(destinations):
+            if dest in settled:
+                costs[i, j] = distance[dest]
+                origin_paths.append(reconstruct_path(parents, src, dest) if return_paths else None)
+            else:
+                origin_paths.append(None)
+        paths.append(origin_paths)
+    if return_paths:
+        return costs, paths
+    return costs
+
+
+def a_star(graph, src, dest, heuristic=None, goal_heuristic=None, deadline=None):
+    """
+    Goal directed A* search
+    Edges are weighted by heuristic just as in dijkstra, but vertices are expanded in order of their distance from src
+    plus goal_heuristic's estimate of their distance to dest, so the search is steered towards dest
+    The route is optimal as long as goal_heuristic never overestimates the remaining distance (in the units of
+    heuristic's weights) and never drops by more than an edge's weight across that edge
+    :param graph: graph that will be used to find optimal path
+    :param src: the source vertex to search from
+    :param dest: the destination vertex to search to
+    :param heuristic: the heuristic function used as an edge weight, djikstra_heuristic if not given
+    :param goal_heuristic: a function of (graph, vertex, dest) giving a lower bound on the distance from vertex to
+    dest, haversine_goal_bound if not given
+    :param deadline: the target deadline value used in heuristic functions
+    :return: a list which is the optimal path (in the same order as dijkstra), or None if dest can't be reached
+    """
+    if heuristic is None:
+        heuristic = djikstra_heuristic
+    if goal_heuristic is None:
+        goal_heuristic = haversine_goal_bound
+    distance = {src: 0}  # the distance value of each reached vertex
+    parents = PathParents()  # the parent of each reached vertex, with respect to optimal path
+    settled = set()  # the vertices whose optimal distance is known
+    bounds = {}  # the goal heuristic of each reached vertex, so it is only found once
+    q = [(goal_heuristic(graph, src, dest), src.get_identifier(), src)]
+    graph.set_deadline(deadline)
 
-    while not q.empty():
-        current_vertex = graph.vertices[q.get()[1]]
+    while q:
+        _, _, current_vertex = heappop(q)
+        if current_vertex in settled:
+            continue
+        settled.add(current_vertex)
         if current_vertex == dest:
             return reconstruct_path(parents, src, dest)
         if current_vertex not in graph.connections:
@@ -107,11 +236,163 @@ def dijkstra(graph, src, dest, heuristic, deadline=None):
         if current_vertex not in graph.seen:
             graph.add_seen(current_vertex)
         for connection in graph.connections[current_vertex]:
+            if connection in settled:
+                continue
             best_move = distance[current_vertex] + heuristic(graph, current_vertex, connection, parents)
-            if best_move < distance[connection]:
+            if connection not in distance or best_move < distance[connection]:
                 distance[connection] = best_move
                 parents[connection] = current_vertex
-                q.put((best_move, connection.get_identifier()))
+                if connection not in bounds:
+                    bounds[connection] = goal_heuristic(graph, connection, dest)
+                heappush(q, (best_move + bounds[connection], connection.get_identifier(), connection))
+    return None
+
+
+def haversine_goal_bound(graph, vertex, dest):
+    """
+    Goal heuristic for a_star when edges are weighted by distance (djikstra_heuristic)
+    The great circle distance is the shortest possible route, so it is a lower bound as long as edge distances are
+    haversine distances in kilometers, as they are for graphs made by parse_osm
+    :param graph: the graph, unused
+    :param vertex: the vertex whose distance to dest is estimated
+    :param dest: the destination vertex
+    :return: the haversine distance in kilometers from vertex to dest, a float
+    """
+    return haversine(vertex, dest)
+
+
+def travel_time_goal_bound(graph, vertex, dest):
+    """
+    Goal heuristic for a_star when edges are weighted by travel time (average_time)
+    Travelling the great circle distance at the graph's highest speed limit is the fastest possible route, so it is a
+    lower bound as long as travel times come from calculate_travel_times (jams only make them longer)
+    :param graph: the graph, used for its highest speed limit
+    :param vertex: the vertex whose travel time to dest is estimated
+    :param dest: the destination vertex
+    :return: the travel time from vertex to dest at the highest speed limit, in the units of average_time (a float)
+    """
+    max_speed_limit = graph.get_max_speed_limit()
+    if not max_speed_limit:
+        return 0
+    return haversine(vertex, dest) / max_speed_limit
+
+
+def landmark_goal_bound(graph, vertex, dest):
+    """
+    Goal heuristic for a_star using the landmarks from graph.build_landmarks (ALT)
+    The triangle inequality at each landmark bounds the remaining distance, which is much tighter than the haversine
+    bounds on road graphs. The edge weight heuristic has to match the landmarks' weight: djikstra_heuristic for
+    "distance" and travel_time_heuristic for "average_time"
+    :param graph: the graph, used for its landmarks
+    :param vertex: the vertex whose distance to dest is estimated
+    :param dest: the destination vertex
+    :return: a lower bound on the distance from vertex to dest, a float
+    """
+    return graph.landmarks.lower_bound(vertex, dest)
+
+
+def travel_time_heuristic(graph, src, dest, parents):
+    """
+    Heuristic that weights an edge by its average travel time, the edge weight that travel_time_goal_bound bounds
+    :param graph: the graph
+    :param src: source vertex
+    :param dest: dest vertex
+    :param parents: unused for this function; included so that the more sophisticated heuristics can also be passed
+    :return: the average travel time between src and dest, a number (float)
+    """
+    return graph.edges[(src, dest)].get_average_time()
+
+
+def bidirectional_dijkstra(graph, src, dest, heuristic=None, deadline=None):
+    """
+    Bidirectional Dijkstra's algorithm for point to point queries
+    Searches forward from src over graph.connections and backward from dest over graph.reverse_connections, always
+    expanding the side whose next vertex is closer, and stops once the two closest vertices left can't improve on the
+    best path found through a vertex reached by both searches
+    The backward search doesn't know the route from src, so heuristic is called with empty parents, which makes it a
+    fixed edge weight. Heuristics that depend on the route so far (mean, deviation, normal) should use dijkstra.
+    :param graph: graph that will be used to find optimal path
+    :param src: the source vertex to search from
+    :param dest: the destination vertex to search to
+    :param heuristic: the heuristic function used as a weight, djikstra_heuristic if not given
+    :param deadline: the target deadline value used in heuristic functions
+    :return: a list which is the optimal path (in the same order as dijkstra), or None if dest can't be reached
+    """
+    if heuristic is None:
+        heuristic = djikstra_heuristic
+    if src == dest:
+        return [src]
+    graph.set_deadline(deadline)
+    adjacency = (graph.connections, graph.reverse_connections)
+    distance = ({src: 0}, {dest: 0})  # the distance value of each reached vertex, forward and backward
+    parents = ({}, {})  # the parent of each reached vertex, towards src going forward and towards dest going backward
+    settled = (set(), set())
+    q = ([(0, src.get_identifier(), src)], [(0, dest.get_identifier(), dest)])
+    best_distance = inf  # the length of the best path found through a vertex reached by both searches
+    meeting_vertex = None
+
+    while q[0] and q[1]:
+        if q[0][0][0] + q[1][0][0] >= best_distance:
+            # no vertex left in either queue can be on a shorter path
+            break
+        side = 0 if q[0][0][0] <= q[1][0][0] else 1
+        current_distance, _, current_vertex = heappop(q[side])
+        if current_vertex in settled[side]:
+            continue
+        settled[side].add(current_vertex)
+        if current_vertex not in graph.seen:
+            graph.add_seen(current_vertex)
+        for connection in adjacency[side].get(current_vertex, []):
+            if connection in settled[side]:
+                continue
+            if side == 0:
+                best_move = current_distance + heuristic(graph, current_vertex, connection, {})
+            else:
+                # going backward, the edge runs from connection to current_vertex
+                best_move = current_distance + heuristic(graph, connection, current_vertex, {})
+            if connection not in distance[side] or best_move < distance[side][connection]:
+                distance[side][connection] = best_move
+                parents[side][connection] = current_vertex
+                heappush(q[side], (best_move, connection.get_identifier(), connection))
+            if connection in distance[1 - side] and \
+                    distance[side][connection] + distance[1 - side][connection] < best_distance:
+                best_distance = distance[side][connection] + distance[1 - side][connection]
+                meeting_vertex = connection
+
+    if meeting_vertex is None:
+        return None
+    # the backward half runs from the meeting vertex to dest, so it is flipped to line up with the forward half
+    backward_path = reconstruct_path(parents[1], dest, meeting_vertex)
+    return backward_path[:0:-1] + reconstruct_path(parents[0], src, meeting_vertex)
+
+
+def csr_dijkstra(csr, src, dest, weight="distance"):
+    """
+    Dijkstra's algorithm over the compact CSR representation of a graph, using one of its static edge weights
+    Vertices are dense integer indices, so each relaxation is a few list lookups instead of hashing vertex objects
+    :param csr: the CSRGraph to search, from Graph.to_csr()
+    :param src: the source vertex to search from (a vertex object)
+    :param dest: the destination vertex to search to (a vertex object)
+    :param weight: the name of the edge weight to minimize, "distance" or "average_time"
+    :return: a list which is the optimal path (in the same order as dijkstra), or None if dest can't be reached
+    """
+    offsets, targets, weights = csr.lists(weight)
+    cost, path = shortest_path(offsets, targets, weights, csr.get_index(src), csr.get_index(dest))
+    return None if path is None else csr.path_vertices(path)
+
+
+def hierarchy_search(graph, src, dest):
+    """
+    Point to point query on the contraction hierarchy from graph.build_hierarchy
+    Both searches only go upward in the hierarchy and the shortcuts on the path found are unpacked, so the path is the
+    same as dijkstra would find with the hierarchy's weight (djikstra_heuristic for "distance" and
+    travel_time_heuristic for "average_time"), as long as edge weights haven't changed since it was built
+    :param graph: the graph, used for its hierarchy
+    :param src: the source vertex to search from
+    :param dest: the destination vertex to search to
+    :return: a list which is the optimal path (in the same order as dijkstra), or None if dest can't be reached
+    """
+    return graph.hierarchy.query(src, dest)
 
 
 def djikstra_heuristic(graph, src, dest, parents):
@@ -232,70 +513,89 @@ def deviation_heuristic(graph, src, dest, parents):
 def single_traffic_heuristic(graph, src, dest, parents):
     """
     A heuristic for just using traffic jams, correlations, and times to calculate a path
+    The highest correlation between the evaluated edge and any jam is kept by the graph as jams change, so it is
+    looked up rather than found by going through every jam
     :param graph: the input graph
     :param src: the source node
     :param dest: the destination node
     :param parents: the parents hash, unused
     :return: distance, an int/float detailing the weight of the evaluated edge
     """
-    distance = 0
     true_edge = graph.edges[(src, dest)]
-    max_corr = 0
-    for jam in graph.jams:
-        # for each jam, see the correlation between the jammed edge and the evaluated edge
-        # looking for the maximum jam
-        jam_corr = graph.edge_correlation[true_edge.identifier][jam.identifier]
-        if jam_corr > max_corr:
-            max_corr = jam_corr
+    max_corr = graph.get_jam_influence(true_edge)
     current_weight = true_edge.average_time
     distance = (current_weight * max_corr) + current_weight
     return distance
 
 
+def path_statistics(graph, vertex, parents, stats):
+    """
+    Finds the mean and variance of the travel time of the path to a vertex, following parents back to the source
+    The statistics of each vertex on the path are kept in stats, as (parent, mean, variance, edge identifier, edge
+    standard deviation, parent's statistics), so only the vertices that don't have statistics yet are worked out.
+    Adding an edge to a path adds its mean and variance, plus its covariance with each edge already on the path.
+    :param graph: the graph the path is on
+    :param vertex: the vertex at the end of the path (a vertex object)
+    :param parents: the parents hash of the search
+    :param stats: the hash of vertex to statistics to read from and add to
+    :return: the statistics of the path to vertex, a tuple with the mean at index 1 and the variance at index 2
+    """
+    # walk back until a vertex with statistics that are still for its current parent, or the source, is found
+    chain = []
+    current = vertex
+    while current in parents:
+        current_stats = stats.get(current)
+        if current_stats is not None and current_stats[0] is parents[current]:
+            break
+        chain.append(current)
+        current = parents[current]
+    else:
+        current_stats = EMPTY_PATH_STATISTICS
+
+    correlations = graph.edge_correlation
+    for current in reversed(chain):
+        parent = parents[current]
+        edge = graph.edges[(parent, current)]
+        deviation = edge.standard_deviation_time
+        covariance = deviation * correlations[edge.identifier][edge.identifier]
+        path_stats = current_stats
+        while path_stats[3] is not None:
+            covariance += path_stats[4] * correlations[path_stats[3]][edge.identifier]
+            path_stats = path_stats[5]
+        current_stats = (parent, current_stats[1] + edge.average_time,
+                         current_stats[2] + deviation ** 2 + 2 * deviation * covariance, edge.identifier, deviation,
+                         current_stats)
+        stats[current] = current_stats
+    return current_stats
+
+
 def normal_dist_traffic(graph, src, dest, parents):
     """
     Heuristic that uses a normal distribution to determine the probability that a route will take you to a
     given destination in the time allotted (business logic overview)
+    The mean and variance of the route are kept for each vertex when parents is a PathParents (as it is in dijkstra
+    and a_star), so each vertex's route is only added up once
+    scipy is imported the first time this is called, which adds about a second to the first query that uses it
     :param graph: the graph to be used by the algorithm
     :param src: the source node for the newly evaluated edge
     :param dest: the destination node for the newly evaluated edge
     :param parents: the parents graph which allows the route's normal distribution to be created
     :return: total_weight a numerical (int/double) value representing the weight of the newly evaluated edge
     """
-    current = None
+    global norm
+    if norm is None:
+        from scipy.stats import norm
     # if we have no parents, then just proceed as normal
-    if src in parents:
-        current = parents[src]
-    else:
+    if src not in parents:
         return graph.edges[(src, dest)].get_average_time()
-    path = [src]
-    while current:
-        path.append(current)
-        if current in parents:
-            current = parents[current]
-        else:
-            current = None
-
-    path = path[::-1]   # reverse the path for ease of traversal
-    normal_mean = 0
-    normal_var = 0
-    edges = []
-    for i in range(1, len(path)):
-        edge = graph.edges[(path[i-1], path[i])]
-        normal_mean += edge.average_time
-        edges.append(edge)
-    for i in range(len(edges)):
-        start_edge = edges[i]
-        normal_var += (start_edge.standard_deviation_time ** 2)
-        for j in range(i, len(edges)):
-            end_edge = edges[j]
-            normal_var += (2 * start_edge.standard_deviation_time * end_edge.standard_deviation_time *
-                           graph.edge_correlation[start_edge.identifier][end_edge.identifier])
-    normal_var = sqrt(normal_var)
+    stats = parents.stats if isinstance(parents, PathParents) else {}
+    route_stats = path_statistics(graph, src, parents, stats)
+    normal_mean = route_stats[1]
+    normal_var = sqrt(route_stats[2])
 
     # Get the probability that this route meets the deadline using the probability density function (PDF) of the
     # normal distribution of normal_mean and normal_var
-    p = norm(loc=normal_mean, scale=normal_var).pdf(graph.deadline)
+    p = norm.pdf(graph.deadline, loc=normal_mean, scale=normal_var)
     # total_weight = graph.edges[(src, dest)].get_average_time()
     # total_weight += total_weight * (1-p)
     total_weight = 1 - p
@@ -0,0 +1,262 @@
+"""
+Houses a uniform grid index over the positions of a graph's vertices, for snapping GPS coordinates to the nearest
+vertices without searching every vertex
+Distances are haversine distances in kilometers, the same as the edge distances of graphs made by parse_osm
+"""
+import numpy
+from math import radians, sin, cos, asin
+from OSMParser import haversine_radians
+
+EARTH_RADIUS = 6372.8  # Earth radius in kilometers, the same as haversine uses
+VERTICES_PER_CELL = 4  # the average number of vertices in a grid cell, when the cell size isn't given
+
+
+class SpatialIndex:
+    """
+    SpatialIndex Class
+    The vertices are sorted by the grid cell they fall in, so the vertices of the cell at (row, column) are at
+    positions cell_offsets[row * columns + column] up to cell_offsets[row * columns + column + 1] of the sorted arrays
+    :field vertices: a list of vertex objects, ordered by their grid cell
+    :field latitudes: a numpy float array of each vertex's latitude, in radians
+    :field cos_latitudes: a numpy float array of the cosine of each vertex's latitude
+    :field longitudes: a numpy float array of each vertex's longitude, in degrees
+    :field min_latitude: the latitude of the bottom edge of the grid, in degrees
+    :field min_longitude: the longitude of the left edge of the grid, in degrees
+    :field cell_size: the height and width of a grid cell, in degrees
+    :field rows: the number of rows of cells in the grid, an int
+    :field columns: the number of columns of cells in the grid, an int
+    :field cell_offsets: a numpy int array of length (rows * columns + 1), the start of each cell's vertices
+    :field min_cos_latitude: the lowest cosine of any latitude in the grid, used to bound distances across longitudes
+    """
+    vertices = []
+    latitudes = None
+    cos_latitudes = None
+    longitudes = None
+    min_latitude = 0.0
+    min_longitude = 0.0
+    cell_size = 0.0
+    rows = 0
+    columns = 0
+    cell_offsets = None
+    min_cos_latitude = 1.0
+
+    def __init__(self, vertices, cell_size=None):
+        """
+        Constructor for the SpatialIndex Class, sorts the vertices into a grid of square cells
+        :param vertices: a list of vertex objects to be indexed
+        :param OPTIONAL cell_size: the height and width of a grid cell in degrees, if not given it is picked so that
+        there would be about VERTICES_PER_CELL vertices in each cell if they were spread over a square as wide as the
+        longer side of their bounding box (so vertices along a line aren't split into a cell each)
+        """
+        vertices = list(vertices)
+        latitudes = numpy.array([vertex.get_latitude() for vertex in vertices], dtype=numpy.float64)
+        longitudes = numpy.array([vertex.get_longitude() for vertex in vertices], dtype=numpy.float64)
+        if vertices:
+            self.min_latitude = float(latitudes.min())
+            self.min_longitude = float(longitudes.min())
+            height = float(latitudes.max()) - self.min_latitude
+            width = float(longitudes.max()) - self.min_longitude
+        else:
+            height = width = 0.0
+        if cell_size is None:
+            cell_size = max(height, width) * (VERTICES_PER_CELL / max(len(vertices), 1)) ** 0.5
+        self.cell_size = max(cell_size, 1e-9)
+        self.rows = int(height / self.cell_size) + 1
+        self.columns = int(width / self.cell_size) + 1
+
+        cells = self.cell_rows(latitudes) * self.columns + self.cell_columns(longitudes)
+        order = numpy.argsort(cells, kind='stable')
+        counts = numpy.bincount(cells, minlength=self.rows * self.columns)
+        self.cell_offsets = numpy.concatenate(([0], numpy.cumsum(counts))).astype(numpy.int64)
+        self.vertices = [vertices[i] for i in order.tolist()]
+        self.latitudes = numpy.radians(latitudes[order])
+        self.cos_latitudes = numpy.cos(self.latitudes)
+        self.longitudes = longitudes[order]
+        max_latitude = float(numpy.abs(latitudes).max()) if vertices else 0.0
+        self.min_cos_latitude = cos(radians(min(max_latitude, 90.0)))
+
+    def cell_rows(self, latitudes):
+        """
+        Finds the row of the grid cell each latitude falls in, clamped to the grid
+        :param latitudes: a numpy float array of latitudes, in degrees
+        :return: a numpy int array of rows
+        """
+        rows = numpy.floor((latitudes - self.min_latitude) / self.cell_size).astype(numpy.int64)
+        return numpy.clip(rows, 0, self.rows - 1)
+
+    def cell_columns(self, longitudes):
+        """
+        Finds the column of the grid cell each longitude falls in, clamped to the grid
+        :param longitudes: a numpy float array of longitudes, in degrees
+        :return: a numpy int array of columns
+        """
+        columns = numpy.floor((longitudes - self.min_longitude) / self.cell_size).astype(numpy.int64)
+        return numpy.clip(columns, 0, self.columns - 1)
+
+    def block_positions(self, first_row, last_row, first_column, last_column):
+        """
+        Gets the positions of the vertices in a block of grid cells
+        :param first_row: the lowest row of the block
+        :param last_row: the highest row of the block
+        :param first_column: the lowest column of the block
+        :param last_column: the highest column of the block
+        :return: a numpy int array of positions in the sorted arrays
+        """
+        first_row = max(first_row, 0)
+        last_row = min(last_row, self.rows - 1)
+        first_column = max(first_column, 0)
+        last_column = min(last_column, self.columns - 1)
+        if first_row > last_row or first_column > last_column:
+            return numpy.zeros(0, dtype=numpy.int64)
+        # the cells of a row are next to each other in the sorted arrays, so each row of the block is one slice
+        starts = numpy.arange(first_row, last_row + 1) * self.columns
+        begins = self.cell_offsets[starts + first_column]
+        ends = self.cell_offsets[starts + last_column + 1]
+        return numpy.concatenate([numpy.arange(begin, end) for begin, end in zip(begins.tolist(), ends.tolist())])
+
+    def distances(self, latitude, longitude, positions):
+        """
+        Finds the haversine distance from a position to some of the indexed vertices
+        :param latitude: the latitude of the position, in degrees
+        :param longitude: the longitude of the position, in degrees
+        :param positions: a numpy int array of positions in the sorted arrays
+        :return: a numpy float array of distances in kilometers
+        """
+        latitude = radians(latitude)
+        # the longitudes are subtracted before being converted, the same as haversine() does
+        return haversine_radians(latitude, cos(latitude), self.latitudes[positions], self.cos_latitudes[positions],
+                                 numpy.radians(self.longitudes[positions] - longitude))
+
+    def outside_bound(self, latitudes, rings):
+        """
+        Finds a lower bound on the distance from positions to any vertex outside a block of cells around their cell
+        A vertex outside the block is at least rings cells away in latitude or in longitude
+        :param latitudes: a numpy float array of the latitudes of the positions, in degrees
+        :param rings: the number of cells the block reaches out from the positions' cell, an int
+        :return: a numpy float array of lower bounds in kilometers
+        """
+        gap = min(radians(rings * self.cell_size), numpy.pi)
+        # the cosine of the farthest latitude from the equator bounds how short a difference in longitude can be
+        latitude_cos = numpy.cos(numpy.radians(numpy.minimum(numpy.abs(latitudes), 90.0)))
+        cos_bound = numpy.minimum(self.min_cos_latitude, latitude_cos)
+        longitude_bound = 2 * numpy.arcsin(numpy.minimum(1.0, cos_bound * sin(gap / 2)))
+        return EARTH_RADIUS * numpy.minimum(gap, longitude_bound)
+
+    def rings_needed(self, latitudes, distances):
+        """
+        Finds the fewest rings of cells around positions that must be searched for outside_bound to reach distances
+        :param latitudes: a numpy float array of the latitudes of the positions, in degrees
+        :param distances: a numpy float array of distances in kilometers
+        :return: the number of rings, an int (more than the grid has if no block of cells is enough)
+        """
+        latitude_cos = numpy.cos(numpy.radians(numpy.minimum(numpy.abs(latitudes), 90.0)))
+        cos_bound = numpy.minimum(self.min_cos_latitude, latitude_cos)
+        # outside_bound solved for the gap, the difference in longitude is the shorter of its two bounds
+        half_sin = numpy.sin(numpy.minimum(distances / EARTH_RADIUS, numpy.pi) / 2)
+        if numpy.any(half_sin >= cos_bound):
+            return max(self.rows, self.columns)
+        gap = float((2 * numpy.arcsin(half_sin / cos_bound)).max())
+        return int(numpy.ceil(numpy.degrees(gap) / self.cell_size))
+
+    def nearest_many(self, points, k=1):
+        """
+        Finds the k vertices closest to each of a batch of positions
+        Positions in the same grid cell are searched together, looking through rings of cells around the cell until no
+        vertex outside the rings can be closer than the k closest found, with the distances from every position in the
+        cell to every vertex in the rings found in one numpy pass. Once k vertices are found, the search jumps straight
+        to the rings that the k-th closest distance calls for, and until then the rings are doubled
+        :param points: a list of (latitude, longitude) coordinates, in degrees
+        :param OPTIONAL k: the number of vertices to find for each position, an int
+        :return: a list with, for each position, a list of (distance in kilometers, vertex object) from closest to
+        farthest
+        """
+        coordinates = numpy.array(points, dtype=numpy.float64).reshape(-1, 2)
+        results = [[] for i in range(len(coordinates))]
+        k = min(k, len(self.vertices))
+        if k <= 0:
+            return results
+        latitudes = coordinates[:, 0]
+        longitudes = coordinates[:, 1]
+        radian_latitudes = numpy.radians(latitudes)
+        cos_latitudes = numpy.cos(radian_latitudes)
+        cells = self.cell_rows(latitudes) * self.columns + self.cell_columns(longitudes)
+        order = numpy.argsort(cells, kind='stable')
+        cell_starts = numpy.flatnonzero(numpy.diff(cells[order], prepend=-1))
+        max_rings = max(self.rows, self.columns)
+        for group in numpy.split(order, cell_starts[1:]):
+            row, column = divmod(int(cells[group[0]]), self.columns)
+            rings = 0
+            while len(group):
+                positions = self.block_positions(row - rings, row + rings, column - rings, column + rings)
+                if len(positions) >= k:
+                    # a row of distances for each position in the group, to every vertex in the rings
+                    distances = haversine_radians(radian_latitudes[group, None], cos_latitudes[group, None],
+                                                  self.latitudes[None, positions], self.cos_latitudes[None, positions],
+                                                  numpy.radians(self.longitudes[None, positions] -
+                                                                longitudes[group, None]))
+                    if len(positions) > k:
+                        closest = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+                    else:
+                        closest = numpy.broadcast_to(numpy.arange(k), (len(group), k))
+                    closest_distances = numpy.take_along_axis(distances, closest, axis=1)
+                    if rings >= max_rings:
+                        done = numpy.ones(len(group), dtype=bool)
+                    else:
+                        done = closest_distances.max(axis=1) <= self.outside_bound(latitudes[group], rings)
+                    for i in numpy.flatnonzero(done).tolist():
+                        ranked = numpy.argsort(closest_distances[i], kind='stable')
+                        results[group[i]] = [(float(closest_distances[i, j]), self.vertices[positions[closest[i, j]]])
+                                             for j in ranked.tolist()]
+                    remaining = ~done
+                    group = group[remaining]
+                    if len(group):
+                        needed = self.rings_needed(latitudes[group], closest_distances[remaining].max(axis=1))
+                        rings = min(max(needed, rings + 1), max_rings)
+                else:
+                    rings = min(max(rings * 2, 1), max_rings)
+        return results
+
+    def nearest(self, latitude, longitude, k=1):
+        """
+        Finds the k vertices closest to a position
+        :param latitude: the latitude of the position, in degrees
+        :param longitude: the longitude of the position, in degrees
+        :param OPTIONAL k: the number of vertices to find, an int
+        :return: a list of (distance in kilometers, vertex object), from closest to farthest
+        """
+        return self.nearest_many([(latitude, longitude)], k)[0]
+
+    def snap(self, points):
+        """
+        Snaps a batch of GPS coordinates to their nearest vertices
+        :param points: a list of (latitude, longitude) coordinates, in degrees
+        :return: a list of the nearest vertex object to each point (None if nothing is indexed)
+        """
+        return [found[0][1] if found else None for found in self.nearest_many(points, 1)]
+
+    def within(self, latitude, longitude, radius):
+        """
+        Finds every vertex within a distance of a position
+        :param latitude: the latitude of the position, in degrees
+        :param longitude: the longitude of the position, in degrees
+        :param radius: the max distance from the position, in kilometers
+        :return: a list of (distance in kilometers, vertex object), from closest to farthest
+        """
+        if not self.vertices:
+            return []
+        angle = radius / EARTH_RADIUS
+        cos_bound = min(self.min_cos_latitude, cos(radians(min(abs(latitude), 90.0))))
+        latitude_reach = numpy.degrees(angle)
+        if angle >= numpy.pi or sin(angle / 2) >= cos_bound:
+            # the radius reaches around the globe in longitude
+            longitude_reach = 360.0
+        else:
+            longitude_reach = numpy.degrees(2 * asin(sin(angle / 2) / cos_bound))
+        first_row, last_row = self.cell_rows(numpy.array([latitude - latitude_reach, latitude + latitude_reach]))
+        first_column, last_column = self.cell_columns(numpy.array([longitude - longitude_reach,
+                                                                   longitude + longitude_reach]))
+        positions = self.block_positions(int(first_row), int(last_row), int(first_column), int(last_column))
+        distances = self.distances(latitude, longitude, positions)
+        inside = numpy.flatnonzero(distances <= radius)
+        inside = inside[numpy.argsort(distances[inside], kind='stable')]
+        return [(float(distances[i]), self.vertices[positions[i]]) for i in inside.tolist()]
@@ -1,10 +1,22 @@
-from Graph import Graph, Vertex, Edge
+from Graph import Graph, Vertex, Edge, DEFAULT_SPEED_LIMIT
 from SearchAlgorithms import dfs, dijkstra, djikstra_heuristic, a_star_heuristic, \
-    mean_heuristic, deviation_heuristic, single_traffic_heuristic, normal_dist_traffic
+    mean_heuristic, deviation_heuristic, single_traffic_heuristic, normal_dist_traffic, path_distance, csr_dijkstra, \
+    bidirectional_dijkstra, a_star, haversine_goal_bound, landmark_goal_bound, hierarchy_search, travel_time_matrix, \
+    dijkstra_search, path_statistics
+from BatchRouting import batch_route
+from RouteCache import RouteCache
+from SpatialIndex import SpatialIndex
 from GraphDisplay import draw_graph
 from networkx import read_shp
-from OSMParser import parse_osm
+from OSMParser import parse_osm, osm_cache_key, read_cached_osm, segment_lengths, haversine
 from datetime import datetime
+from math import sqrt
+from random import Random
+from tempfile import TemporaryDirectory
+from os.path import join, dirname, abspath
+from os import listdir
+import subprocess
+import sys
 
 
 def get_test_graph():
@@ -33,6 +45,30 @@ def get_test_graph():
     return Graph([one_two, one_four, two_three, four_five, four_six, six_seven, five_eight, eight_nine, three_nine])
 
 
+def get_grid_graph(size=6, seed=0):
+    """
+    Creates a square grid of two way roads with random lengths and speed limits, so every edge has a travel time
+    :param size: the number of vertices along each side of the grid, an int
+    :param seed: the seed for the random lengths and speed limits
+    :return: a Graph.py representation of the grid
+    """
+    random = Random(seed)
+    vertices = [Vertex(row * size + column, 32.8 + row * 0.001, -96.8 + column * 0.001)
+                for row in range(size) for column in range(size)]
+    edges = []
+    for row in range(size):
+        for column in range(size):
+            vertex = vertices[row * size + column]
+            neighbors = ([vertices[row * size + column + 1]] if column + 1 < size else []) + \
+                        ([vertices[(row + 1) * size + column]] if row + 1 < size else [])
+            for neighbor in neighbors:
+                distance = haversine(vertex, neighbor) * (1 + random.random())
+                speed_limit = random.choice([25, 35, 45])
+                edges.append(Edge(vertex, neighbor, distance, standard_deviation_time=0.01, speed_limit=speed_limit))
+                edges.append(Edge(neighbor, vertex, distance, standard_deviation_time=0.01, speed_limit=speed_limit))
+    return Graph(edges)
+
+
 def test_save_graph_to_file():
     """
     Tests the file saving functionality by getting a test graph, writing it to a file,
@@ -160,7 +196,8 @@ def test_box_roads():
     print_graph(graph)
     start = graph.get_vertex(0)
     end = graph.get_vertex(33)
-    graph.specify_jams([((10, 0), (0, 10))])
+    for entry, reason in graph.specify_jams([((10, 0), (0, 10))]):
+        print("Jam", entry, reason)
     paths = [test_graph_algorithm(graph, dijkstra, start, end, "Box Roads A*", a_star_heuristic),
              # test_graph_algorithm(graph, dijkstra, start, end, "Box Roads Mean", mean_heuristic),
              # test_graph_algorithm(graph, dijkstra, start, end, "Box Roads Deviation", deviation_heuristic),
@@ -169,23 +206,617 @@ def test_box_roads():
     color_convert_draw_graph(graph, paths, "Box Roads", "box_roads")
 
 
-# Run some algorithms on the test graph
-test_graph = get_test_graph()
-print_graph(test_graph)
-start = test_graph.get_vertex(0)
-end = test_graph.get_vertex(8)
-test_dfs(test_graph, start, end)
-test_dijkstra(test_graph, start, end)
-test_a_star(test_graph, start, end)
-
-# Run some algorithms on an OSM extract of UD's Irving campus
-osm_graph = test_parse_osm('shapefiles/OSMCampus.osm', "OSM Campus", "osm_campus")
-print_graph(osm_graph)
-start = osm_graph.get_vertex(list(osm_graph.vertices.keys())[0])
-end = osm_graph.get_vertex(list(osm_graph.vertices.keys())[47])
-test_dfs(osm_graph, start, end)
-test_dijkstra(osm_graph, start, end)
-test_a_star(osm_graph, start, end)
-
-# Run some algorithms on the BoxRoads test graph
-test_box_roads()
+def test_correlation_stores(graph, sample_size=40):
+    """
+    Checks that the other ways of storing correlations give the same correlations as the dense double list, for the
+    rows of a sample of edges
+    :param graph: a Graph.py representation of a graph, with dense correlations
+    :param sample_size: the number of edges whose rows are compared, an int
+    """
+    edges = list(graph.edges.values())
+    edge_ids = sorted(edge.identifier for edge in edges)
+    sample = Random(0).sample(edge_ids, min(sample_size, len(edge_ids)))
+    with TemporaryDirectory() as directory:
+        stores = [("Sparse", Graph(edges, correlation_epsilon=0)),
+                  ("Memory-mapped", Graph(edges, correlation_file=join(directory, "correlations.npy"))),
+                  # a cache far smaller than the sample, so rows are thrown out and found again
+                  ("Lazy", Graph(edges, lazy_correlations=True, correlation_cache_size=4))]
+        for name, store_graph in stores:
+            # the copies share their edges with graph, so the jams made for them are undone
+            store_graph.clear_jams()
+            # the sample is gone through twice, so lazy rows that were thrown out are found again
+            for first_id in sample + sample:
+                for second_id in edge_ids:
+                    assert abs(store_graph.edge_correlation[first_id][second_id] -
+                               graph.edge_correlation[first_id][second_id]) < 1e-6, \
+                        "{0} correlation between edges {1} and {2} differs".format(name, first_id, second_id)
+            print('{:<15}'.format(name) + ": same correlations as dense for", len(sample), "edges")
+
+
+def get_vertex_pairs(graph, count=100, seed=0):
+    """
+    Picks src/dest pairs of vertices at random, with a seeded random number generator so the same pairs are checked
+    every run
+    :param graph: a Graph.py representation of a graph
+    :param count: the number of pairs to pick, an int
+    :param seed: the seed of the random number generator
+    :return: a list of (src, dest) vertices
+    """
+    vertices = [graph.vertices[identifier] for identifier in sorted(graph.vertices.keys())]
+    random = Random(seed)
+    return [(random.choice(vertices), random.choice(vertices)) for i in range(count)]
+
+
+def edge_values(graph):
+    """
+    Gets every edge of a graph with its identifier and values, keyed by the identifiers of its vertices so that
+    graphs read back from files can be compared with the original
+    :param graph: a Graph.py representation of a graph
+    :return: a hash of (first vertex id, second vertex id) to a tuple of the edge's identifier and values
+    """
+    return {(first.get_identifier(), second.get_identifier()):
+            (edge.identifier, edge.distance, edge.average_time, edge.standard_deviation_time, edge.speed_limit,
+             edge.average_speed, edge.standard_deviation_speed)
+            for (first, second), edge in graph.edges.items()}
+
+
+def check_read_graph(graph, new_graph, name):
+    """
+    Checks that a graph read back from a file has the same edges and correlations as the original, and that a traffic
+    search runs on it
+    :param graph: the Graph.py representation of a graph that was written
+    :param new_graph: the Graph.py representation of the graph that was read
+    :param name: the name of the file format, for the failure message
+    """
+    assert edge_values(new_graph) == edge_values(graph), name + " edges changed"
+    for edge in graph.edges.values():
+        for other in graph.edges.values():
+            assert abs(new_graph.edge_correlation[edge.identifier][other.identifier] -
+                       graph.edge_correlation[edge.identifier][other.identifier]) < 1e-6, \
+                "{0} correlation between edges {1} and {2} changed".format(name, edge.identifier, other.identifier)
+    src, dest = get_vertex_pairs(new_graph, 1)[0]
+    dijkstra(new_graph, src, dest, single_traffic_heuristic)
+
+
+def test_binary_round_trip(graph):
+    """
+    Writes a graph to a binary file and reads it back, checking that the edges, correlations, and jams are the same,
+    and that the same jams are picked next on both
+    :param graph: a Graph.py representation of a graph
+    """
+    scenario = graph.record_jams()
+    with TemporaryDirectory() as directory:
+        graph.write_binary(join(directory, "test.npz"))
+        new_graph = Graph.read_binary(join(directory, "test.npz"))
+        check_read_graph(graph, new_graph, "Binary")
+        assert new_graph.record_jams() == scenario, "Binary jams changed"
+    for step in ("created", "cleared and created"):
+        if step != "created":
+            graph.clear_jams()
+            new_graph.clear_jams()
+        graph.create_jams(5)
+        new_graph.create_jams(5)
+        assert new_graph.record_jams() == graph.record_jams(), "Binary jams differ once jams are " + step
+    # the graph is given back the jams it had
+    graph.replay_jams(scenario)
+    print('{:<15}'.format("Binary") + ": round trip kept", graph.get_num_edges(), "edges and", len(graph.jams),
+          "jams")
+
+
+def read_text_graph(file_name):
+    """
+    Reads a graph from a text file without any jams, since text files don't keep the jams and reading one jams new
+    edges at random
+    :param file_name: the name of the file to be read
+    :return: a Graph.py representation of the graph
+    """
+    graph = Graph.read_graph(file_name)
+    graph.clear_jams()
+    return graph
+
+
+def test_text_round_trip(graph):
+    """
+    Writes a graph to a text file and reads it back, checking that the edges and correlations are the same, both on
+    their own and after a binary file is read, which mustn't change how the text file's edges are numbered
+    :param graph: a Graph.py representation of a graph
+    """
+    with TemporaryDirectory() as directory:
+        graph.write_graph(join(directory, "test.txt"))
+        check_read_graph(graph, read_text_graph(join(directory, "test.txt")), "Text")
+        graph.write_binary(join(directory, "test.npz"))
+        Graph.read_binary(join(directory, "test.npz"))
+        check_read_graph(graph, read_text_graph(join(directory, "test.txt")), "Text after binary")
+    print('{:<15}'.format("Text") + ": round trip kept", graph.get_num_edges(), "edges")
+
+
+def test_parse_osm_stream(osm_path):
+    """
+    Checks that parsing an OSM extract as a stream gives the same vertices and edges as parsing it as a whole tree
+    :param osm_path: a path to an .osm file
+    """
+    graph = parse_osm(osm_path)
+    stream_graph = parse_osm(osm_path, stream=True)
+    # the jams are picked at random, so they are cleared before the edges' times are compared
+    graph.clear_jams()
+    stream_graph.clear_jams()
+    coordinates = {identifier: (vertex.get_latitude(), vertex.get_longitude())
+                   for identifier, vertex in graph.vertices.items()}
+    stream_coordinates = {identifier: (vertex.get_latitude(), vertex.get_longitude())
+                          for identifier, vertex in stream_graph.vertices.items()}
+    assert stream_coordinates == coordinates, "Streamed vertices differ"
+    assert edge_values(stream_graph) == edge_values(graph), "Streamed edges differ"
+    print('{:<15}'.format("OSM Stream") + ": same", len(graph.vertices), "vertices and", graph.get_num_edges(),
+          "edges")
+
+
+def test_osm_cache(osm_path):
+    """
+    Checks that parsing an OSM extract a second time with the same options reads back the same graph from the cache,
+    and that parsing it with different options doesn't
+    :param osm_path: a path to an .osm file
+    """
+    with TemporaryDirectory() as directory:
+        graph = parse_osm(osm_path, cache_dir=directory)
+        key = osm_cache_key(osm_path, {})
+        assert read_cached_osm(directory, key) is not None, "The graph wasn't cached"
+        cached_graph = parse_osm(osm_path, cache_dir=directory)
+        check_read_graph(graph, cached_graph, "OSM Cache")
+        # the jams are picked at random when a graph is built, so matching jams show the graph was read from the cache
+        assert set(jam.identifier for jam in cached_graph.jams) == set(jam.identifier for jam in graph.jams), \
+            "The cached graph's jams changed"
+        assert osm_cache_key(osm_path, {'correlation_hops': 3}) != key, "A changed option kept the same cache key"
+        parse_osm(osm_path, cache_dir=directory, correlation_hops=3)
+        assert len([name for name in listdir(directory) if name.endswith(".graph")]) == 2, \
+            "A changed option was read from the cache"
+    print('{:<15}'.format("OSM Cache") + ": cached graph read back the same")
+
+
+def test_segment_lengths(graph):
+    """
+    Checks that the segment lengths found in one numpy pass are the same as the haversine distance of each segment
+    :param graph: a Graph.py representation of a graph
+    """
+    segments = [(edge.first_vertex, edge.second_vertex) for edge in graph.edges.values()]
+    for (first, second), length in zip(segments, segment_lengths(segments).tolist()):
+        expected = haversine(first, second)
+        assert abs(length - expected) <= 1e-9 * max(1, expected), \
+            "Segment from {0} to {1} is {2} km, haversine gives {3} km".format(first, second, length, expected)
+    print('{:<15}'.format("Segments") + ": same lengths as haversine for", len(segments), "segments")
+
+
+def check_same_costs(graph, pairs, paths, name):
+    """
+    Checks that the paths found by an algorithm are as short as the ones dijkstra finds with djikstra_heuristic
+    :param graph: a Graph.py representation of a graph
+    :param pairs: a list of (src, dest) vertices
+    :param paths: the path the algorithm found for each pair (in the same order as dijkstra), or None
+    :param name: the name of the algorithm, for the failure message
+    """
+    for (src, dest), path in zip(pairs, paths):
+        expected = dijkstra(graph, src, dest, djikstra_heuristic)
+        if expected is None:
+            assert path is None, "{0} found a path from {1} to {2} that dijkstra didn't".format(name, src, dest)
+            continue
+        assert path is not None, "{0} found no path from {1} to {2}".format(name, src, dest)
+        assert path[0] == dest and path[-1] == src, \
+            "{0} path from {1} to {2} has the wrong ends".format(name, src, dest)
+        cost = path_distance(graph, path)
+        expected_cost = path_distance(graph, expected)
+        assert abs(cost - expected_cost) <= 1e-9 * max(1, expected_cost), \
+            "{0} cost {1} from {2} to {3}, dijkstra cost {4}".format(name, cost, src, dest, expected_cost)
+    print('{:<15}'.format(name) + ": same costs as dijkstra for", len(pairs), "pairs")
+
+
+def test_csr_dijkstra(graph, pairs):
+    """
+    Checks that dijkstra over the CSR representation finds paths with the same cost as dijkstra
+    :param graph: a Graph.py representation of a graph
+    :param pairs: a list of (src, dest) vertices
+    """
+    csr = graph.to_csr()
+    paths = [csr_dijkstra(csr, src, dest, "distance") for src, dest in pairs]
+    check_same_costs(graph, pairs, paths, "CSR Dijkstra")
+
+
+def test_bidirectional_dijkstra(graph, pairs):
+    """
+    Checks that bidirectional dijkstra finds paths with the same cost as dijkstra
+    :param graph: a Graph.py representation of a graph
+    :param pairs: a list of (src, dest) vertices
+    """
+    paths = [bidirectional_dijkstra(graph, src, dest, djikstra_heuristic) for src, dest in pairs]
+    check_same_costs(graph, pairs, paths, "Bidirectional")
+
+
+def test_a_star_haversine(graph, pairs):
+    """
+    Checks that A* with the haversine bound finds paths with the same cost as dijkstra
+    :param graph: a Graph.py representation of a graph, whose edge distances are haversine distances
+    :param pairs: a list of (src, dest) vertices
+    """
+    paths = [a_star(graph, src, dest, djikstra_heuristic, haversine_goal_bound) for src, dest in pairs]
+    check_same_costs(graph, pairs, paths, "A* Haversine")
+
+
+def test_a_star_landmarks(graph, pairs):
+    """
+    Checks that A* with the landmark bound finds paths with the same cost as dijkstra
+    :param graph: a Graph.py representation of a graph
+    :param pairs: a list of (src, dest) vertices
+    """
+    graph.build_landmarks(weight="distance")
+    paths = [a_star(graph, src, dest, djikstra_heuristic, landmark_goal_bound) for src, dest in pairs]
+    check_same_costs(graph, pairs, paths, "A* Landmarks")
+
+
+def test_hierarchy_search(graph, pairs):
+    """
+    Checks that the contraction hierarchy finds paths with the same cost as dijkstra
+    :param graph: a Graph.py representation of a graph
+    :param pairs: a list of (src, dest) vertices
+    """
+    graph.build_hierarchy(weight="distance")
+    paths = [hierarchy_search(graph, src, dest) for src, dest in pairs]
+    check_same_costs(graph, pairs, paths, "Hierarchy")
+
+
+def test_travel_time_matrix(graph, pairs):
+    """
+    Checks that the travel time matrix has the same costs and paths as dijkstra for every origin and destination
+    :param graph: a Graph.py representation of a graph
+    :param pairs: a list of (src, dest) vertices, whose srcs are the origins and dests are the destinations
+    """
+    origins = list(dict.fromkeys(src for src, dest in pairs))[:10]
+    destinations = list(dict.fromkeys(dest for src, dest in pairs))[:10]
+    costs, paths = travel_time_matrix(graph, origins, destinations, djikstra_heuristic, return_paths=True)
+    matrix_pairs = [(src, dest) for src in origins for dest in destinations]
+    check_same_costs(graph, matrix_pairs, [path for row in paths for path in row], "Matrix")
+    for i, src in enumerate(origins):
+        for j, dest in enumerate(destinations):
+            path = paths[i][j]
+            expected_cost = float('inf') if path is None else path_distance(graph, path)
+            assert abs(costs[i, j] - expected_cost) <= 1e-9 * max(1, expected_cost) or costs[i, j] == expected_cost, \
+                "Matrix cost {0} from {1} to {2} doesn't match its path".format(costs[i, j], src, dest)
+
+
+def test_batch_route(graph, pairs):
+    """
+    Checks that routing a batch across worker processes finds paths with the same cost as dijkstra
+    :param graph: a Graph.py representation of a graph
+    :param pairs: a list of (src, dest) vertices
+    """
+    results = list(batch_route(graph, pairs, "distance", processes=2))
+    check_same_costs(graph, pairs, [path for cost, path in results], "Batch Route")
+    for (src, dest), (cost, path) in zip(pairs, results):
+        expected_cost = float('inf') if path is None else path_distance(graph, path)
+        assert abs(cost - expected_cost) <= 1e-9 * max(1, expected_cost) or cost == expected_cost, \
+            "Batch cost {0} from {1} to {2} doesn't match its path".format(cost, src, dest)
+
+
+def test_route_cache():
+    """
+    Checks that the route cache answers a repeated query without searching, and searches again once the graph's
+    travel times or edge weights change
+    """
+    graph = get_grid_graph()
+    cache = RouteCache(graph)
+    src, dest = graph.get_vertex(0), graph.get_vertex(len(graph.vertices) - 1)
+    path = cache.route(src, dest, djikstra_heuristic)
+    assert cache.route(src, dest, djikstra_heuristic) == path and (cache.hits, cache.misses) == (1, 1), \
+        "A repeated query wasn't answered from the cache"
+    graph.calculate_travel_times()
+    cache.route(src, dest, djikstra_heuristic)
+    assert (cache.hits, cache.misses) == (1, 2), "A query after the travel times changed was answered from the cache"
+    edge = next(iter(graph.edges.values()))
+    # setting a weight to the value it already has still changes the graph's version
+    graph.set_edge_weight(edge, 'distance', edge.distance)
+    cache.route(src, dest, djikstra_heuristic)
+    assert (cache.hits, cache.misses) == (1, 3), "A query after an edge weight changed was answered from the cache"
+    print('{:<15}'.format("Route Cache") + ": repeated query hit, changed graph missed")
+
+
+def reference_normal_dist_traffic(graph, src, dest, parents):
+    """
+    The normal_dist_traffic heuristic as it was before the path statistics were kept, which adds up the whole route
+    to src on every call
+    :param graph: the graph to be used by the algorithm
+    :param src: the source node for the newly evaluated edge
+    :param dest: the destination node for the newly evaluated edge
+    :param parents: the parents graph which allows the route's normal distribution to be created
+    :return: the weight of the newly evaluated edge
+    """
+    from scipy.stats import norm
+    if src not in parents:
+        return graph.edges[(src, dest)].get_average_time()
+    mean, variance = route_statistics(graph, src, parents)
+    return 1 - norm(loc=mean, scale=sqrt(variance)).pdf(graph.deadline)
+
+
+def route_statistics(graph, vertex, parents):
+    """
+    Adds up the mean and variance of the travel time of the route to a vertex from scratch
+    :param graph: the graph the route is on
+    :param vertex: the vertex at the end of the route
+    :param parents: the parents hash of a search
+    :return: (mean, variance) of the route's travel time
+    """
+    path = [vertex]
+    while path[-1] in parents:
+        path.append(parents[path[-1]])
+    path = path[::-1]
+    edges = [graph.edges[(path[i - 1], path[i])] for i in range(1, len(path))]
+    mean = sum(edge.average_time for edge in edges)
+    variance = 0
+    for i in range(len(edges)):
+        variance += edges[i].standard_deviation_time ** 2
+        for j in range(i, len(edges)):
+            variance += (2 * edges[i].standard_deviation_time * edges[j].standard_deviation_time *
+                         graph.edge_correlation[edges[i].identifier][edges[j].identifier])
+    return mean, variance
+
+
+def test_path_statistics():
+    """
+    Checks on a small grid that the running path statistics of every vertex equal the mean and standard deviation
+    added up from its route, and that normal_dist_traffic finds the same routes as the heuristic it replaced
+    """
+    graph = get_grid_graph()
+    vertices = sorted(graph.vertices.values(), key=lambda vertex: vertex.get_identifier())
+    src = vertices[0]
+    # the deadline is the mean travel time of the shortest route across the grid, so routes near it are uncertain
+    corner_path = dijkstra(graph, src, vertices[-1], djikstra_heuristic)
+    deadline = sum(graph.edges[(corner_path[i - 1], corner_path[i])].average_time for i in range(1, len(corner_path)))
+    graph.set_deadline(deadline)
+    distance, parents, settled = dijkstra_search(graph, src, vertices, normal_dist_traffic)
+    for vertex in parents:
+        stats = path_statistics(graph, vertex, parents, parents.stats)
+        mean, variance = route_statistics(graph, vertex, parents)
+        assert abs(stats[1] - mean) < 1e-9 and abs(sqrt(stats[2]) - sqrt(variance)) < 1e-9, \
+            "Path statistics of vertex " + str(vertex.get_identifier()) + " don't match its route"
+    for dest in vertices[1:]:
+        path = dijkstra(graph, src, dest, normal_dist_traffic, deadline)
+        assert path == dijkstra(graph, src, dest, reference_normal_dist_traffic, deadline), \
+            "Normal dist traffic routes to vertex " + str(dest.get_identifier()) + " differ"
+    print('{:<15}'.format("Path Statistics") + ": " + str(len(parents)) + " vertices and routes match")
+
+
+def test_startup_time(modules=("Graph", "SearchAlgorithms", "OSMParser")):
+    """
+    Checks that importing the routing core in a fresh interpreter doesn't import the display and statistics
+    dependencies (networkx, plotly, scipy) along with it
+    :param modules: the names of the modules to be imported
+    :return: the time the imports took, in seconds (a float)
+    """
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import " + ", ".join(modules) + "\n"
+            "print(time.perf_counter() - start)\n"
+            "print(' '.join(name for name in ('networkx', 'plotly', 'scipy') if name in sys.modules))\n")
+    output = subprocess.run([sys.executable, "-c", code], cwd=dirname(abspath(__file__)), stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout.split("\n")
+    seconds = float(output[0])
+    heavy_modules = output[1].split()
+    print('{:<15}'.format("Startup") + " ({0:.3f} seconds): ".format(seconds), ", ".join(modules))
+    assert not heavy_modules, "Heavy modules imported at startup: " + ", ".join(heavy_modules)
+    return seconds
+
+
+def test_jam_influence(graph, jam_count=20):
+    """
+    Checks that the jam influence kept by the graph is each edge's highest correlation to any jammed edge, as
+    single_traffic_heuristic used to find by going through every jam, after jams are created, cleared and specified
+    :param graph: a Graph.py representation of a graph
+    :param jam_count: the number of jams to create, an int
+    """
+    edges = list(graph.edges.values())
+    with TemporaryDirectory() as directory:
+        stores = [("Dense", Graph(edges)),
+                  ("Memory-mapped", Graph(edges, correlation_file=join(directory, "correlations.npy")))]
+        for name, store_graph in stores:
+            def check(step):
+                for edge in edges:
+                    expected = 0
+                    for jam in store_graph.jams:
+                        expected = max(expected, store_graph.edge_correlation[edge.identifier][jam.identifier])
+                    assert abs(store_graph.get_jam_influence(edge) - expected) < 1e-6, \
+                        "{0} jam influence of edge {1} is wrong after {2}".format(name, edge.identifier, step)
+            check("the graph was made")
+            store_graph.create_jams(jam_count)
+            check("jams were created")
+            store_graph.clear_jams()
+            check("jams were cleared")
+            store_graph.specify_jams([((edge.first_vertex.get_latitude(), edge.first_vertex.get_longitude()),
+                                       (edge.second_vertex.get_latitude(), edge.second_vertex.get_longitude()))
+                                      for edge in edges[:3]])
+            check("jams were specified")
+            # the copies share their edges with graph, so their jams are undone
+            store_graph.clear_jams()
+            print('{:<15}'.format(name) + ": jam influence matches every jam's correlations")
+
+
+def test_specify_jams():
+    """
+    Checks that specify_jams jams the edges it can find, and reports the entries it couldn't jam as given with why
+    """
+    one, two, three = Vertex(0, 0, 0), Vertex(1, 10, 2), Vertex(2, 20, 65)
+    graph = Graph([Edge(one, two, 5, 1), Edge(two, three, 3, 1)])
+
+    def coordinates(vertex):
+        return vertex.get_latitude(), vertex.get_longitude()
+    forward = (coordinates(one), coordinates(two))
+    reverse = (coordinates(three), coordinates(two))
+    missing_edge = (coordinates(one), coordinates(three))
+    missing_vertex = (coordinates(one), (-1, -1))
+    unresolved = graph.specify_jams([forward, reverse, missing_edge, missing_vertex])
+    assert unresolved == [(reverse, "reversed"), (missing_edge, "edge not found"),
+                          (missing_vertex, "vertex not found")], "Unexpected unresolved jams: " + str(unresolved)
+    assert graph.jams == {graph.edges[(one, two)], graph.edges[(two, three)]}, "The wrong edges were jammed"
+    print('{:<15}'.format("Specify Jams") + ": " + str(len(unresolved)) + " entries reported")
+
+
+def check_spatial_index(name, vertices, query_count=100, k=5, seed=0):
+    """
+    Checks the nearest, within and snap queries of a SpatialIndex against the haversine distance to every vertex, for
+    positions inside and around the box the vertices are in
+    :param name: the name of the vertices, to print
+    :param vertices: a list of vertex objects
+    :param query_count: the number of positions to query, an int
+    :param k: the number of nearest vertices to check, an int
+    :param seed: the seed for picking positions
+    """
+    index = SpatialIndex(vertices)
+    # the grid shouldn't have more cells than vertices, even if the vertices are all along one line
+    assert index.rows * index.columns <= len(vertices), \
+        "{0} grid has {1} by {2} cells".format(name, index.rows, index.columns)
+    latitudes = [vertex.get_latitude() for vertex in vertices]
+    longitudes = [vertex.get_longitude() for vertex in vertices]
+    height = max(max(latitudes) - min(latitudes), 0.01)
+    width = max(max(longitudes) - min(longitudes), 0.01)
+    random = Random(seed)
+    # half of the positions are outside of the box the vertices are in, and so outside the grid
+    points = [(random.uniform(min(latitudes) - height, max(latitudes) + height),
+               random.uniform(min(longitudes) - width, max(longitudes) + width)) for i in range(query_count)]
+    snapped = index.snap(points)
+    for (latitude, longitude), snapped_vertex in zip(points, snapped):
+        position = Vertex(-1, latitude, longitude)
+        distances = sorted(haversine(position, vertex) for vertex in vertices)
+        nearest = [distance for distance, vertex in index.nearest(latitude, longitude, k)]
+        assert all(abs(found - expected) < 1e-9 for found, expected in zip(nearest, distances[:k])), \
+            "{0} nearest to {1} differs from brute force".format(name, (latitude, longitude))
+        assert abs(haversine(position, snapped_vertex) - distances[0]) < 1e-9, \
+            "{0} snap of {1} isn't to the nearest vertex".format(name, (latitude, longitude))
+        # a radius between two distances, so rounding can't decide whether a vertex is inside
+        radius = (distances[k - 1] + distances[k]) / 2
+        within = [distance for distance, vertex in index.within(latitude, longitude, radius)]
+        assert len(within) == k and all(abs(found - expected) < 1e-9 for found, expected in zip(within, distances)), \
+            "{0} within {1} km of {2} differs from brute force".format(name, radius, (latitude, longitude))
+    print('{:<15}'.format(name) + ": nearest, within and snap match brute force for", query_count, "positions")
+
+
+def test_spatial_index(graph):
+    """
+    Checks the spatial index against brute force, for the vertices of a graph and for vertices along a line
+    :param graph: a Graph.py representation of a graph
+    """
+    check_spatial_index("Spatial Index", list(graph.vertices.values()))
+    check_spatial_index("Line Index", [Vertex(i, 32.85, -96.9 + i * 0.0001) for i in range(2000)])
+
+
+def reference_expand_speeds(graph):
+    """
+    The loop expand_speeds used before it was a breadth first search, for comparing against on small graphs
+    It goes through the vertex objects where the old loop went through the vertex identifiers (which connections isn't
+    keyed by), and like the old loop it never ends if a road without a speed limit can't reach one that has one
+    :param graph: a Graph.py representation of a graph, with speed limits of 0 for the roads without one
+    """
+    while graph.zero_speed_limit():
+        for first_vert in graph.vertices.values():
+            if first_vert not in graph.connections:
+                continue
+            for second_vert in graph.connections[first_vert]:
+                start_edge = graph.edges[(first_vert, second_vert)]
+                if start_edge.get_speed_limit() == 0:
+                    # take a speed limit from a road leaving the end of this one
+                    if second_vert not in graph.connections:
+                        continue
+                    for third_vert in graph.connections[second_vert]:
+                        current_limit = graph.edges[(second_vert, third_vert)].get_speed_limit()
+                        if current_limit == 0:
+                            continue
+                        if current_limit > 40:
+                            current_limit = max(current_limit - 5, 40)
+                        start_edge.speed_limit = current_limit
+                        break
+                else:
+                    # spread this road's speed limit to the roads leaving the end of it
+                    if second_vert not in graph.connections:
+                        continue
+                    current_limit = start_edge.get_speed_limit()
+                    if current_limit > 40:
+                        current_limit = max(current_limit - 5, 40)
+                    for third_vert in graph.connections[second_vert]:
+                        if graph.edges[(second_vert, third_vert)].get_speed_limit() == 0:
+                            graph.edges[(second_vert, third_vert)].speed_limit = current_limit
+
+
+def test_expand_speeds():
+    """
+    Checks that expand_speeds gives roads that can't reach a speed limit DEFAULT_SPEED_LIMIT, and that the speed
+    limits it spreads from a road with one are the same as the loop it replaced found
+    """
+    vertices = [Vertex(i, 32.8 + i * 0.001, -96.8) for i in range(14)]
+    # a road of one way edges with a speed limit in the middle, and a branch off of it after the speed limit
+    signed = [Edge(vertices[i], vertices[i + 1], 1, speed_limit=70 if i == 3 else 0) for i in range(7)] + \
+             [Edge(vertices[4], vertices[8], 1, speed_limit=0), Edge(vertices[8], vertices[9], 1)]
+    # a two way road that isn't connected to any speed limit, marked with both 0 and None
+    unsigned = [Edge(vertices[10], vertices[11], 1, speed_limit=0), Edge(vertices[11], vertices[10], 1),
+                Edge(vertices[11], vertices[12], 1, speed_limit=0), Edge(vertices[12], vertices[13], 1)]
+    graph = Graph(signed + unsigned)
+    for edge in unsigned:
+        assert edge.speed_limit == DEFAULT_SPEED_LIMIT and edge.average_time, \
+            "Edge {0} wasn't given the default speed limit".format(edge.identifier)
+    expanded = [edge.speed_limit for edge in signed]
+    for edge in signed:
+        if edge.speed_limit != 70:
+            edge.speed_limit = 0
+    reference_expand_speeds(graph)
+    assert expanded == [edge.speed_limit for edge in signed], \
+        "Expanded speed limits {0} differ from {1}".format(expanded, [edge.speed_limit for edge in signed])
+    print('{:<15}'.format("Expand Speeds") + ": " + ", ".join(str(speed_limit) for speed_limit in expanded))
+
+
+# the demos and checks only run when this file is run directly, so its functions can be imported (batch_route's
+# worker processes import it too, when they are spawned)
+if __name__ == "__main__":
+    # Check that the routing core starts up without its heavy dependencies
+    test_startup_time()
+
+    # Run some algorithms on the test graph
+    test_graph = get_test_graph()
+    print_graph(test_graph)
+    start = test_graph.get_vertex(0)
+    end = test_graph.get_vertex(8)
+    test_dfs(test_graph, start, end)
+    test_dijkstra(test_graph, start, end)
+    test_a_star(test_graph, start, end)
+    test_specify_jams()
+    test_expand_speeds()
+
+    # Run some algorithms on an OSM extract of UD's Irving campus
+    osm_graph = test_parse_osm('shapefiles/OSMCampus.osm', "OSM Campus", "osm_campus")
+    print_graph(osm_graph)
+    start = osm_graph.get_vertex(list(osm_graph.vertices.keys())[0])
+    end = osm_graph.get_vertex(list(osm_graph.vertices.keys())[47])
+    test_dfs(osm_graph, start, end)
+    test_dijkstra(osm_graph, start, end)
+    test_a_star(osm_graph, start, end)
+
+    # Check that the faster algorithms find paths as short as dijkstra's on the OSM campus
+    pairs = get_vertex_pairs(osm_graph)
+    test_bidirectional_dijkstra(osm_graph, pairs)
+    test_a_star_haversine(osm_graph, pairs)
+    test_a_star_landmarks(osm_graph, pairs)
+    test_hierarchy_search(osm_graph, pairs)
+    test_travel_time_matrix(osm_graph, pairs)
+    test_batch_route(osm_graph, pairs)
+    test_route_cache()
+    test_path_statistics()
+    test_csr_dijkstra(osm_graph, pairs)
+
+    # Check that the other correlation stores give the same correlations as the dense double list
+    test_correlation_stores(osm_graph)
+    test_jam_influence(osm_graph)
+
+    # Check that graphs (and their jams) come back the same from files
+    test_binary_round_trip(osm_graph)
+    test_text_round_trip(osm_graph)
+
+    # Check that the ways of parsing OSM extracts agree
+    test_parse_osm_stream('shapefiles/OSMCampus.osm')
+    test_osm_cache('shapefiles/OSMCampus.osm')
+    test_segment_lengths(osm_graph)
+    test_spatial_index(osm_graph)
+
+    # Run some algorithms on the BoxRoads test graph
+    test_box_roads()